@@ -18,7 +18,7 @@ from agno.tools.file import FileTools
 from agno.tools.reasoning import ReasoningTools
 from groq import Groq as GroqClient
 
-from src.config import settings, get_model_config, AGENT_CONFIGS
+from src.config import settings, get_model_config, AGENT_CONFIGS, DEFAULT_AGENT_SPEC
 
 # Asegurar que se cargue la variable de entorno
 from dotenv import load_dotenv
@@ -174,7 +174,7 @@ class BaseEducationalAgent(ABC):
         
         # Obtener configuración específica del agente
         self.config = get_model_config(agent_type)
-        agent_config = AGENT_CONFIGS.get(agent_type, {})
+        agent_config = AGENT_CONFIGS.get(agent_type, DEFAULT_AGENT_SPEC)
         
         # Configurar modelo Groq usando un cliente explícito para evitar el error 'proxies'
         try:
@@ -200,14 +200,13 @@ class BaseEducationalAgent(ABC):
             raise
         
         # Combinar instrucciones base con personalizadas
-        base_instructions = agent_config.get("instructions", [])
-        instructions = base_instructions + (custom_instructions or [])
+        instructions = [*agent_config.instructions, *(custom_instructions or ())]
         
         # Herramientas base
         base_tools = []
-        if agent_config.get("enable_file_tools", False):
+        if agent_config.enable_file_tools:
             base_tools.append(FileTools())
-        if agent_config.get("enable_reasoning_tools", True):
+        if agent_config.enable_reasoning_tools:
             base_tools.append(ReasoningTools())
         
         # Combinar con herramientas personalizadas
@@ -23,6 +23,8 @@ from dotenv import load_dotenv
 import json
 import hashlib
 import uuid
+import atexit
+from functools import lru_cache
 
 # Importar Groq para respuestas
 try:
@@ -64,6 +66,17 @@ AZURE_SEARCH_ENDPOINT = os.getenv("AZURE_SEARCH_ENDPOINT", "https://juliaai.sear
 AZURE_SEARCH_KEY = os.getenv("AZURE_SEARCH_KEY", "")
 AZURE_SEARCH_INDEX = os.getenv("UNIVERSITY_INDEX_NAME", "universidad")
 
+@lru_cache(maxsize=1)
+def _build_search_client(endpoint: str, index_name: str, key: str) -> SearchClient:
+    """SearchClient compartido: reutiliza el pipeline HTTP y sus conexiones entre instancias"""
+    client = SearchClient(
+        endpoint=endpoint,
+        index_name=index_name,
+        credential=AzureKeyCredential(key)
+    )
+    atexit.register(client.close)
+    return client
+
 class EducationalDocumentManager:
     """Gestor de documentos educativos personales del usuario con Azure Search"""
     
@@ -79,11 +92,8 @@ class EducationalDocumentManager:
         """Configurar cliente de Azure Search"""
         try:
             if AZURE_SEARCH_KEY and AZURE_SEARCH_ENDPOINT:
-                credentials = AzureKeyCredential(AZURE_SEARCH_KEY)
-                self.search_client = SearchClient(
-                    endpoint=AZURE_SEARCH_ENDPOINT,
-                    index_name=AZURE_SEARCH_INDEX,
-                    credential=credentials
+                self.search_client = _build_search_client(
+                    AZURE_SEARCH_ENDPOINT, AZURE_SEARCH_INDEX, AZURE_SEARCH_KEY
                 )
                 print(f"✅ Azure Search configurado: {AZURE_SEARCH_INDEX}")
             else:
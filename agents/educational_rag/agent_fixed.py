@@ -10,6 +10,19 @@ from datetime import datetime
 import hashlib
 import json
 
+try:
+    import orjson
+
+    def _dump_line(document: Dict[str, Any]) -> bytes:
+        return orjson.dumps(document, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+
+    _load_line = orjson.loads
+except ImportError:
+    def _dump_line(document: Dict[str, Any]) -> bytes:
+        return (json.dumps(document, ensure_ascii=False) + "\n").encode("utf-8")
+
+    _load_line = json.loads
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -24,6 +37,29 @@ except ImportError:
     logger.warning("⚠️ Azure Search config no disponible")
     SEARCH_AVAILABLE = False
 
+# Almacén local de último recurso: un documento JSON por línea (append-only)
+LOCAL_DOCS_DIR = "local_documents"
+LOCAL_INDEX_PATH = os.path.join(LOCAL_DOCS_DIR, "index.jsonl")
+
+def _iter_local_documents():
+    """Documentos del índice JSONL y de los .json sueltos escritos por versiones anteriores"""
+    if not os.path.exists(LOCAL_DOCS_DIR):
+        return
+    if os.path.exists(LOCAL_INDEX_PATH):
+        with open(LOCAL_INDEX_PATH, 'rb') as f:
+            for line in f:
+                try:
+                    yield _load_line(line)
+                except ValueError:
+                    continue
+    for filename in os.listdir(LOCAL_DOCS_DIR):
+        if filename.endswith('.json'):
+            try:
+                with open(os.path.join(LOCAL_DOCS_DIR, filename), 'r', encoding='utf-8') as f:
+                    yield json.load(f)
+            except:
+                continue
+
 class EducationalRAGAgentFixed:
     """Agente RAG educativo con manejo robusto de errores"""
     
@@ -121,13 +157,10 @@ class EducationalRAGAgentFixed:
             }
     
     def _save_to_file(self, document: Dict[str, Any]):
-        """Guardar documento en archivo como último recurso"""
-        docs_dir = "local_documents"
-        os.makedirs(docs_dir, exist_ok=True)
-        
-        file_path = os.path.join(docs_dir, f"{document['doc_id']}.json")
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(document, f, indent=2, ensure_ascii=False)
+        """Guardar documento en archivo como último recurso (una línea añadida al índice)"""
+        os.makedirs(LOCAL_DOCS_DIR, exist_ok=True)
+        with open(LOCAL_INDEX_PATH, 'ab') as f:
+            f.write(_dump_line(document))
     
     def search_documents(
         self,
@@ -159,48 +192,27 @@ class EducationalRAGAgentFixed:
     
     def _search_in_files(self, query: str, top_k: int) -> List[Dict[str, Any]]:
         """Buscar en archivos locales"""
-        docs_dir = "local_documents"
-        if not os.path.exists(docs_dir):
-            return []
-        
         results = []
         query_lower = query.lower()
         
-        for filename in os.listdir(docs_dir):
-            if filename.endswith('.json'):
-                try:
-                    with open(os.path.join(docs_dir, filename), 'r', encoding='utf-8') as f:
-                        doc = json.load(f)
-                        # Búsqueda simple
-                        if (query_lower in doc.get('content', '').lower() or
-                            query_lower in doc.get('filename', '').lower() or
-                            query_lower in doc.get('subject', '').lower()):
-                            results.append(doc)
-                except:
-                    continue
+        for doc in _iter_local_documents():
+            # Búsqueda simple
+            if (query_lower in doc.get('content', '').lower() or
+                query_lower in doc.get('filename', '').lower() or
+                query_lower in doc.get('subject', '').lower()):
+                results.append(doc)
+                if len(results) >= top_k:
+                    break
         
-        return results[:top_k]
+        return results
     
     def list_documents(self, user_id: str) -> List[Dict[str, Any]]:
         """Listar documentos del usuario"""
         try:
             if self.use_local:
                 # Listar documentos locales
-                docs_dir = "local_documents"
-                if not os.path.exists(docs_dir):
-                    return []
-                
-                documents = []
-                for filename in os.listdir(docs_dir):
-                    if filename.endswith('.json'):
-                        try:
-                            with open(os.path.join(docs_dir, filename), 'r', encoding='utf-8') as f:
-                                doc = json.load(f)
-                                if doc.get('user_id') == user_id or user_id == "system":
-                                    documents.append(doc)
-                        except:
-                            continue
-                return documents
+                return [doc for doc in _iter_local_documents()
+                        if doc.get('user_id') == user_id or user_id == "system"]
             else:
                 # Listar de Azure
                 try:
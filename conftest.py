@@ -0,0 +1,6 @@
+"""Configuración común de pytest: BD de usuarios temporal antes de importar src.auth.users_db"""
+
+import os
+import tempfile
+
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/users.db"
@@ -33,13 +33,20 @@ function AuthProvider({ children }: { children: React.ReactNode }) {
     try {
       const token = typeof window !== 'undefined' ? localStorage.getItem('access_token') : null
       if (!token) { 
-        console.log('[Auth] No token found'); 
-        setUser(null); 
-        setLoading(false); 
+        // Sin token en localStorage: puede haber sesión en cookie HttpOnly (AUTH_HTTPONLY_COOKIE)
+        const cookieRes = await fetch(`${apiBase()}/api/auth/me`, { credentials: 'include' })
+        if (cookieRes.ok) {
+          const data = await cookieRes.json();
+          setUser(data.user);
+          setError(null)
+        } else {
+          console.log('[Auth] No token found'); 
+          setUser(null); 
+        }
         return 
       }
       console.log('[Auth] Checking token...', token.substring(0, 20) + '...');
-      const res = await fetch(`${apiBase()}/api/auth/me`, { headers: { Authorization: `Bearer ${token}` } })
+      const res = await fetch(`${apiBase()}/api/auth/me`, { credentials: 'include', headers: { Authorization: `Bearer ${token}` } })
       if (res.ok) {
         const data = await res.json(); 
         console.log('[Auth] User authenticated:', data.user.email, 'role:', data.user.role);
@@ -72,7 +79,7 @@ function AuthProvider({ children }: { children: React.ReactNode }) {
   const logout = useCallback(async () => {
     try {
       const token = typeof window !== 'undefined' ? localStorage.getItem('access_token') : null
-  if (token) { await fetch(`${apiBase()}/api/auth/logout`, { method: 'POST', headers: { Authorization: `Bearer ${token}` } }) }
+  await fetch(`${apiBase()}/api/auth/logout`, { method: 'POST', credentials: 'include', headers: token ? { Authorization: `Bearer ${token}` } : {} })
     } catch {}
     finally { localStorage.removeItem('access_token'); setUser(null) }
   }, [])
@@ -81,7 +88,7 @@ function AuthProvider({ children }: { children: React.ReactNode }) {
     try {
       const token = typeof window !== 'undefined' ? localStorage.getItem('access_token') : null
       if (!token) return
-  const res = await fetch(`${apiBase()}/api/auth/refresh`, { method: 'POST', headers: { Authorization: `Bearer ${token}` } })
+  const res = await fetch(`${apiBase()}/api/auth/refresh`, { method: 'POST', credentials: 'include', headers: { Authorization: `Bearer ${token}` } })
       if (res.ok) { const data = await res.json(); localStorage.setItem('access_token', data.access_token); await checkAuth() }
       else { localStorage.removeItem('access_token'); setUser(null) }
     } catch {}
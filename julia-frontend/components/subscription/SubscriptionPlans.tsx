@@ -56,9 +56,11 @@ export const SubscriptionPlans: React.FC = () => {
       
   const response = await fetch(`${apiBase()}/api/subscription/checkout`, {
         method: 'POST',
+        // Sin token en localStorage la sesión va en la cookie HttpOnly (AUTH_HTTPONLY_COOKIE)
+        credentials: 'include',
         headers: {
           'Content-Type': 'application/json',
-          'Authorization': `Bearer ${token}`
+          ...(token ? { 'Authorization': `Bearer ${token}` } : {})
         },
         body: JSON.stringify({
           tier,
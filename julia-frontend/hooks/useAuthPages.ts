@@ -32,18 +32,16 @@ export const useAuth = () => {
   const checkAuth = async () => {
     try {
       const token = typeof window !== 'undefined' ? localStorage.getItem('access_token') : null;
-      if (!token) {
-        setAuthState({ user: null, loading: false, error: null });
-        return;
-      }
+      // Sin token en localStorage puede haber sesión en cookie HttpOnly (AUTH_HTTPONLY_COOKIE)
   const response = await fetch(`${apiBase()}/api/auth/me`, {
-        headers: { 'Authorization': `Bearer ${token}` }
+        credentials: 'include',
+        headers: token ? { 'Authorization': `Bearer ${token}` } : {}
       });
       if (response.ok) {
         const data = await response.json();
         setAuthState({ user: data.user, loading: false, error: null });
       } else {
-        localStorage.removeItem('access_token');
+        if (token) localStorage.removeItem('access_token');
         setAuthState({ user: null, loading: false, error: null });
       }
     } catch (error) {
@@ -59,12 +57,12 @@ export const useAuth = () => {
   const logout = useCallback(async () => {
     try {
       const token = localStorage.getItem('access_token');
-      if (token) {
+      // Siempre: /logout expira también la cookie HttpOnly
   await fetch(`${apiBase()}/api/auth/logout`, {
-          method: 'POST',
-          headers: { 'Authorization': `Bearer ${token}` }
-        });
-      }
+        method: 'POST',
+        credentials: 'include',
+        headers: token ? { 'Authorization': `Bearer ${token}` } : {}
+      });
     } catch {}
     finally {
       localStorage.removeItem('access_token');
@@ -76,7 +74,7 @@ export const useAuth = () => {
   const refreshToken = useCallback(async () => {
     try {
       const token = localStorage.getItem('access_token');
-      if (!token) throw new Error('No hay token para refrescar');
+      if (!token) return; // sesión por cookie HttpOnly: expira con el JWT, no se refresca aquí
   const response = await fetch(`${apiBase()}/api/auth/refresh`, {
         method: 'POST',
         headers: { 'Authorization': `Bearer ${token}` }
@@ -3,26 +3,45 @@ Endpoints de autenticación con Google y suscripciones con Stripe
 """
 
 from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response, status
-from fastapi.responses import JSONResponse, HTMLResponse
-from typing import Dict, Any, Optional
-import hmac, hashlib, base64, json, time
+from fastapi.responses import JSONResponse, HTMLResponse, RedirectResponse
+from typing import Dict, Any, Optional, Tuple
+import asyncio, hmac, base64, json, time
 import logging
 import os
+import re
 from datetime import datetime
+from functools import lru_cache
+from urllib.parse import urlparse
+from jinja2 import DictLoader, Environment
+
+# orjson es opcional: si está instalado las respuestas JSON se serializan con él
+try:
+    import orjson  # noqa: F401  (ORJSONResponse lo necesita al serializar)
+    from fastapi.responses import ORJSONResponse as _JSONResponse
+except ImportError:
+    _JSONResponse = JSONResponse
 
 # Importar servicios
 try:
-    from src.auth.google_auth import google_auth, get_current_user, require_subscription, require_teacher
+    from src.auth.google_auth import (
+        google_auth, get_current_user, require_subscription, require_teacher,
+        AUTH_HTTPONLY_COOKIE,
+    )
 except ImportError:  # fallback if executed with package root already at src
-    from auth.google_auth import google_auth, get_current_user, require_subscription, require_teacher
-from auth.users_db import update_role
+    from auth.google_auth import (
+        google_auth, get_current_user, require_subscription, require_teacher,
+        AUTH_HTTPONLY_COOKIE,
+    )
 from payments.stripe_subscription import stripe_service, SubscriptionTier
 
 logger = logging.getLogger(__name__)
 
+# Referencia directa al verificador JWT usado en /me y /debug/auth (ya cachea por token)
+_verify_jwt = google_auth.verify_jwt_token
+
 # Crear router
-auth_router = APIRouter(prefix="/api/auth", tags=["Authentication"])
-subscription_router = APIRouter(prefix="/api/subscription", tags=["Subscriptions"])
+auth_router = APIRouter(prefix="/api/auth", tags=["Authentication"], default_response_class=_JSONResponse)
+subscription_router = APIRouter(prefix="/api/subscription", tags=["Subscriptions"], default_response_class=_JSONResponse)
 
 # Router adicional para capturar redirecciones de OAuth que lleguen sin el prefijo /api
 oauth_redirect_router = APIRouter(prefix="/auth", tags=["OAuth Redirects"])
@@ -30,35 +49,187 @@ oauth_redirect_router = APIRouter(prefix="/auth", tags=["OAuth Redirects"])
 # ==================== ENDPOINTS DE AUTENTICACIÓN ====================
 
 STATE_MAX_AGE = 3600  # 60 minutos para dar más tiempo al flujo OAuth
+# Endpoints /debug/token y /debug/auth solo activos con AUTH_DEBUG=1 (exponen cabeceras y cookies)
+AUTH_DEBUG = os.getenv("AUTH_DEBUG", "").lower() in ("1", "true")
+_COOKIE_MAX_AGE = 86400  # 24 horas, igual que la expiración del JWT
+# Con AUTH_HTTPONLY_COOKIE=1 (definido en google_auth) todos los callbacks emiten la cookie HttpOnly
+# y los de navegador (/auth/*, /google/callback/redirect) responden 302 en vez de la página HTML
+
+def _access_cookie(token: str, secure: bool, httponly: bool = False) -> bytes:
+    """Cabecera Set-Cookie del access_token (por defecto no HttpOnly: el frontend la lee), sin pasar por SimpleCookie."""
+    return (f"access_token={token}; Max-Age={_COOKIE_MAX_AGE}; Path=/; SameSite=Lax"
+            f"{'; Secure' if secure else ''}{'; HttpOnly' if httponly else ''}").encode("latin-1")
+
+def _cookie_redirect(request: Request, url: str, token: str) -> RedirectResponse:
+    """302 al frontend con el token solo en cookie HttpOnly (el perfil se obtiene luego de /api/auth/me)."""
+    secure_flag = (request.headers.get('x-forwarded-proto') == 'https') or (request.url.scheme == 'https')
+    resp = RedirectResponse(url=url, status_code=302)
+    resp.raw_headers.append((b"set-cookie", _access_cookie(token, secure_flag, httponly=True)))
+    return resp
+
+# URLs de despliegue leídas del entorno una sola vez (_reload_env las refresca)
+_PUBLIC_BASE = ""  # ej: https://educational-api.kindbeach-3a240fb9.eastus.azurecontainerapps.io
+_PUBLIC_BASE_PARSED: Optional[Tuple[str, str]] = None  # (proto, host) de _PUBLIC_BASE
+_FRONTEND_URL: Optional[str] = None
+_GOOGLE_REDIRECT = ""
+# Rutas de los callbacks /auth/* y sus redirect_uri absolutos ya resueltos con PUBLIC_BASE_URL
+_CB_PATH = "/auth/google/callback"
+_CB_REDIRECT_PATH = "/auth/google/callback/redirect"
+_PUBLIC_CALLBACK_URIS: Dict[str, str] = {}
+
+def _reload_env() -> None:
+    """Releer PUBLIC_BASE_URL, FRONTEND_URL y GOOGLE_REDIRECT_URI (tests o cambio de config)."""
+    global _PUBLIC_BASE, _PUBLIC_BASE_PARSED, _FRONTEND_URL, _GOOGLE_REDIRECT, _PUBLIC_CALLBACK_URIS
+    _PUBLIC_BASE = os.getenv("PUBLIC_BASE_URL", "").rstrip('/')
+    _FRONTEND_URL = os.getenv("FRONTEND_URL")
+    _GOOGLE_REDIRECT = os.getenv("GOOGLE_REDIRECT_URI", "")
+    if _PUBLIC_BASE:
+        pu = urlparse(_PUBLIC_BASE)
+        _PUBLIC_BASE_PARSED = (pu.scheme or 'https', pu.netloc)
+        _PUBLIC_CALLBACK_URIS = {p: f"{_PUBLIC_BASE}{p}" for p in (_CB_PATH, _CB_REDIRECT_PATH)}
+    else:
+        _PUBLIC_BASE_PARSED = None
+        _PUBLIC_CALLBACK_URIS = {}
+
+_reload_env()
+
+# base64url directo sobre bytes.translate (lo que urlsafe_b64encode hace con una llamada extra)
+_B64URL_ENCODE = bytes.maketrans(b'+/', b'-_')
+_B64URL_DECODE = bytes.maketrans(b'-_', b'+/')
+_B64_PAD = (b'', b'===', b'==', b'=')  # relleno según len % 4 (1 nunca es base64 válido)
 
+@lru_cache(maxsize=1)
 def _oauth_state_secret() -> bytes:
+    # El secreto no cambia en vida del proceso; tras rotarlo usar _oauth_state_secret.cache_clear()
+    # y _verified_states.clear()
     return (getattr(google_auth, 'JWT_SECRET', None) or os.getenv('JWT_SECRET', 'dev_secret')).encode()
 
+# Encoder compacto reutilizable para el formato JSON del state (redirects con '|')
+_STATE_JSON = json.JSONEncoder(separators=(',', ':'))
+
 def _sign_state(payload: Dict[str, Any]) -> str:
-    raw = json.dumps(payload, separators=(',', ':')).encode()
-    b64 = base64.urlsafe_b64encode(raw).decode().rstrip('=')
-    sig = hmac.new(_oauth_state_secret(), b64.encode(), hashlib.sha256).hexdigest()
+    # Formato posicional "t|r|n": n va al final, así puede contener '|' sin romper el split
+    if '|' in payload['r']:
+        raw = _STATE_JSON.encode(payload).encode()
+    else:
+        raw = f"{payload['t']}|{payload['r']}|{payload['n']}".encode()
+    b64 = base64.b64encode(raw).translate(_B64URL_ENCODE).rstrip(b'=').decode()
+    # Firma: base64url de los 32 bytes crudos (43 chars en vez de 64 en hex)
+    digest = hmac.digest(_oauth_state_secret(), b64.encode(), 'sha256')
+    sig = base64.b64encode(digest).translate(_B64URL_ENCODE).rstrip(b'=').decode()
     return f"{b64}.{sig}"
 
+_STATE_MIN_LEN = 40
+_STATE_MAX_LEN = 4096
+_STATE_SIG_LENS = (43, 64)  # base64url de 32 bytes / hex heredado
+
+# States con firma válida ya verificados (reintentos del callback). Solo entran los firmados por
+# nosotros: los strings arbitrarios de clientes no ocupan ni desplazan entradas
+_STATE_CACHE_SIZE = 4096
+_verified_states: Dict[str, Tuple[Tuple[str, Any], ...]] = {}
+
 def _parse_state(state: Optional[str]) -> Optional[Dict[str, Any]]:
-    if not state or '.' not in state:
+    if not state:
+        return None
+    items = _verified_states.get(state)
+    if items is None:
+        items = _verify_state(state)
+        if items is None:
+            return None
+        if len(_verified_states) >= _STATE_CACHE_SIZE:
+            _verified_states.clear()
+        _verified_states[state] = items
+    payload = dict(items)
+    # Un resultado válido cacheado puede haber caducado desde entonces
+    if int(time.time()) - int(payload.get('t', 0)) > STATE_MAX_AGE:
+        return None
+    return payload
+
+def _verify_state(state: str) -> Optional[Tuple[Tuple[str, Any], ...]]:
+    """Decodifica y valida la firma del state (None si es inválido o ha caducado)."""
+    if '.' not in state:
+        return None
+    # Basura evidente (escáneres, states truncados) se descarta sin decodificar ni calcular HMAC
+    if not (_STATE_MIN_LEN <= len(state) <= _STATE_MAX_LEN) or not state.isascii():
         return None
     try:
         b64, sig = state.split('.', 1)
-        expected = hmac.new(_oauth_state_secret(), b64.encode(), hashlib.sha256).hexdigest()
-        if not hmac.compare_digest(sig, expected):
-            logger.warning("STATE firma inválida")
+        if len(sig) not in _STATE_SIG_LENS:
             return None
-        data = base64.urlsafe_b64decode(b64 + '==')
-        payload = json.loads(data.decode())
+        # Revisar expiración antes de calcular el HMAC: un state caducado se
+        # descarta sin gastar SHA-256 (la firma se valida igual si está vigente)
+        data = base64.b64decode(b64.encode().translate(_B64URL_DECODE) + _B64_PAD[len(b64) & 3]).decode()
+        if data.startswith('{'):
+            # States JSON emitidos antes del formato posicional (o con '|' en r)
+            payload = json.loads(data)
+        else:
+            t, r, n = data.split('|', 2)
+            if not r.startswith('http') or not n.startswith('/'):
+                logger.warning("STATE con formato inválido")
+                return None
+            payload = {"r": r, "n": n, "t": int(t)}
         if int(time.time()) - int(payload.get('t', 0)) > STATE_MAX_AGE:
             logger.warning("STATE expirado")
             return None
-        return payload
+        if len(sig) == 64:
+            # Firma hex de states emitidos antes del cambio a base64url
+            sig_bytes = bytes.fromhex(sig)
+        else:
+            sig_bytes = base64.b64decode(sig.encode().translate(_B64URL_DECODE) + b'=')
+        expected = hmac.digest(_oauth_state_secret(), b64.encode(), 'sha256')
+        if not hmac.compare_digest(sig_bytes, expected):
+            logger.warning("STATE firma inválida")
+            return None
+        return tuple(payload.items())
     except Exception as e:
         logger.warning(f"Error parseando state: {e}")
         return None
 
+_ORIGIN_HEADERS = (b"x-forwarded-host", b"x-original-host", b"host", b"x-forwarded-proto")
+
+def _resolve_origin(request: Request, extended: bool = False) -> Tuple[str, str]:
+    """Devuelve (proto, host) recorriendo las cabeceras una sola vez.
+    Con extended=True se aceptan también x-original-host y host como respaldo."""
+    found: Dict[bytes, str] = {}
+    for key, value in request.headers.raw:
+        if key in _ORIGIN_HEADERS and key not in found:
+            found[key] = value.decode("latin-1")
+    raw_host = found.get(b"x-forwarded-host")
+    if not raw_host and extended:
+        raw_host = found.get(b"x-original-host") or found.get(b"host")
+    proto = found.get(b"x-forwarded-proto") or request.url.scheme or 'https'
+    return proto, raw_host or request.url.hostname or ""
+
+# Loopback genuino: 127.x o "localhost" (con o sin puerto), nunca un dominio público
+_LOOPBACK_RE = re.compile(r'127\.|localhost(?::|$)')
+_DEFAULT_PORTS = frozenset((80, 443))
+
+def _resolve_host(request: Request, force_http_loopback: bool = True, prefer_localhost: bool = False,
+                  extended: bool = False) -> Tuple[str, str]:
+    """(proto, host[:puerto]) para construir redirect_uri a partir de la petición.
+    En loopback fuerza http (registros típicos de Google) y opcionalmente 127.x -> localhost."""
+    proto, raw_host = _resolve_origin(request, extended=extended)
+    if _LOOPBACK_RE.match(raw_host):
+        if prefer_localhost and raw_host.startswith("127."):
+            raw_host = "localhost"
+        if force_http_loopback:
+            proto = "http"
+    # Incluir puerto si no estándar y no ya presente en header
+    port = request.url.port
+    if port and port not in _DEFAULT_PORTS and ':' not in raw_host:
+        return proto, f"{raw_host}:{port}"
+    return proto, raw_host
+
+_LOGIN_URL_TTL = 60  # segundos que se reutiliza un auth_url ya firmado
+
+@lru_cache(maxsize=1024)
+def _login_url(base_redirect: str, safe_next: str, bucket: int) -> tuple:
+    """(auth_url, state) firmados para un redirect/next; el bucket temporal de la
+    clave hace que la entrada caduque sola cada _LOGIN_URL_TTL segundos."""
+    signed_state = _sign_state({"r": base_redirect, "n": safe_next, "t": int(time.time())})
+    auth_url = google_auth.get_authorization_url(state=signed_state, redirect_override=base_redirect)
+    return auth_url, signed_state
+
 @auth_router.get("/google/login")
 async def google_login(
     request: Request,
@@ -69,37 +240,15 @@ async def google_login(
     """Login unificado Google: siempre usa callback backend /api/auth/google/callback/redirect.
     Devuelve auth_url y state firmado que incluye redirect y next interno."""
     try:
-        public_base = os.getenv("PUBLIC_BASE_URL")  # ej: https://educational-api.kindbeach-3a240fb9.eastus.azurecontainerapps.io
+        public_base = _PUBLIC_BASE_PARSED
         if public_base:
-            # Normalizar sin slash final
-            public_base = public_base.rstrip('/')
-            from urllib.parse import urlparse
-            pu = urlparse(public_base)
-            proto = pu.scheme or 'https'
-            host = pu.netloc
+            proto, host = public_base
         else:
-            # Cabeceras en orden de preferencia
-            raw_host = (request.headers.get("x-forwarded-host") or
-                        request.headers.get("x-original-host") or
-                        request.headers.get("host") or
-                        request.url.hostname or "")
-            proto = request.headers.get("x-forwarded-proto") or request.url.scheme or 'https'
-            port = request.url.port
-            # Solo forzar localhost en loopback genuino (no en producción)
-            if prefer_localhost and raw_host.startswith("127."):
-                raw_host = "localhost"
-            # No forzar http si tenemos dominio público (contiene un punto y no es localhost)
-            if force_http_loopback and (raw_host.startswith("localhost") or raw_host.startswith("127.")) and '.' not in raw_host:
-                proto = "http"
-            if ':' not in raw_host and port and port not in (80, 443):
-                host = f"{raw_host}:{port}"
-            else:
-                host = raw_host
+            proto, host = _resolve_host(request, force_http_loopback, prefer_localhost, extended=True)
         # Usar el redirect URI que coincide con Google OAuth - /auth/google/callback/redirect
         base_redirect = f"{proto}://{host}/auth/google/callback/redirect"
         safe_next = next if isinstance(next, str) and next.startswith('/') else '/'
-        signed_state = _sign_state({"r": base_redirect, "n": safe_next, "t": int(time.time())})
-        auth_url = google_auth.get_authorization_url(state=signed_state, redirect_override=base_redirect)
+        auth_url, signed_state = _login_url(base_redirect, safe_next, int(time.time()) // _LOGIN_URL_TTL)
         logger.info(f"[oauth] login host={host} redirect={base_redirect} next={safe_next} public_base={'yes' if public_base else 'no'}")
         return {"auth_url": auth_url, "redirect_uri_used": base_redirect, "state": signed_state}
     except Exception as e:
@@ -111,31 +260,44 @@ def _derive_effective_redirect(request: Request, redirect_uri: Optional[str]) ->
     if redirect_uri:
         return redirect_uri
     # Host + puerto real
-    raw_host = request.headers.get("x-forwarded-host") or request.url.hostname or ""
-    port = request.url.port
-    proto = request.headers.get("x-forwarded-proto") or request.url.scheme
-    # Si es loopback forzar http para coincidir con registros típicos
-    if raw_host.startswith("127.") or raw_host.startswith("localhost"):
-        proto = "http"
-    # Incluir puerto si no estándar y no ya presente en header
-    if ':' not in raw_host and port and port not in (80, 443):
-        host = f"{raw_host}:{port}"
-    else:
-        host = raw_host
+    proto, host = _resolve_host(request)
     if not host:
         return None
-    env_redirect = os.getenv("GOOGLE_REDIRECT_URI", "")
+    env_redirect = _GOOGLE_REDIRECT
     if env_redirect and host in env_redirect:
         return env_redirect
     if env_redirect:
         try:
-            from urllib.parse import urlparse
             p = urlparse(env_redirect)
             return f"{proto}://{host}{p.path}"
         except Exception:
             pass
     return f"{proto}://{host}/auth/google/callback/redirect"
 
+# Intercambios de code en curso: solo mientras la petición a Google no ha terminado. Al completarse
+# se retiran, así un replay posterior del mismo code vuelve a Google y falla (code de un solo uso)
+_code_exchanges: Dict[Tuple[str, Optional[str]], "asyncio.Future"] = {}
+
+async def _authenticate_once(code: str, redirect_override: Optional[str] = None):
+    """authenticate_with_google compartido por code mientras está en curso: callbacks duplicados
+    concurrentes (reintentos, doble clic) esperan el mismo intercambio en vez de gastar el code."""
+    key = (code, redirect_override)
+    task = _code_exchanges.get(key)
+    if task is None:
+        task = asyncio.ensure_future(google_auth.authenticate_with_google(code, redirect_override=redirect_override))
+        _code_exchanges[key] = task
+
+        def _forget(done: "asyncio.Future", key=key) -> None:
+            if _code_exchanges.get(key) is done:
+                del _code_exchanges[key]
+        task.add_done_callback(_forget)
+    # shield: si un request se cancela no cancela el intercambio que esperan los demás
+    return await asyncio.shield(task)
+
+def _is_redirect_mismatch(he: HTTPException) -> bool:
+    """El intercambio falló porque Google rechazó el redirect_uri (código OAuth de GoogleTokenError)."""
+    return getattr(he, 'error', None) == 'redirect_uri_mismatch'
+
 def _normalize_redirect(r: Optional[str]) -> Optional[str]:
     if not r:
         return r
@@ -157,13 +319,12 @@ async def google_callback(
     try:
         effective_redirect = _normalize_redirect(_derive_effective_redirect(request, redirect_uri))
         try:
-            auth_token = await google_auth.authenticate_with_google(code, redirect_override=effective_redirect)
+            auth_token = await _authenticate_once(code, redirect_override=effective_redirect)
         except HTTPException as he:
             # Intento de fallback si es redirect_uri mismatch (mensaje típico Google)
-            detail = getattr(he, 'detail', '')
-            if 'redirect_uri' in str(detail).lower():
-                logger.warning("Reintentando intercambio sin override por posible redirect_uri mismatch")
-                auth_token = await google_auth.authenticate_with_google(code, redirect_override=None)
+            if _is_redirect_mismatch(he):
+                logger.warning("Reintentando intercambio sin override por redirect_uri mismatch")
+                auth_token = await _authenticate_once(code, redirect_override=None)
             else:
                 raise
         payload = {
@@ -173,26 +334,22 @@ async def google_callback(
             "message": "Autenticación exitosa",
             "redirect_uri_used": effective_redirect or google_auth.redirect_uri
         }
-        # Construir respuesta y añadir cookie (no HttpOnly para que frontend pueda migrar si esperaba cookie)
-        from datetime import timedelta
-        resp = JSONResponse(payload)
+        # Construir respuesta y añadir cookie (HttpOnly solo con AUTH_HTTPONLY_COOKIE; si no, el frontend puede leerla)
+        resp = _JSONResponse(payload)
         # SECURE: en producción (https) secure=True
         secure_flag = (request.url.scheme == 'https') or (request.headers.get('x-forwarded-proto') == 'https')
-        resp.set_cookie(
-            key="access_token",
-            value=auth_token.access_token,
-            max_age=int(timedelta(hours=24).total_seconds()),
-            httponly=False,
-            secure=secure_flag,
-            samesite="Lax",
-            path="/"
-        )
+        resp.raw_headers.append((b"set-cookie", _access_cookie(auth_token.access_token, secure_flag, httponly=AUTH_HTTPONLY_COOKIE)))
         return resp
     except Exception as e:
         logger.error(f"Error en callback de Google: {type(e).__name__}: {e}")
         raise HTTPException(status_code=400, detail="Error en autenticación con Google (callback)")
 
-# Remove duplicate definitions - keeping only the first set
+@auth_router.post("/logout")
+async def logout():
+    """Cerrar sesión: expira la cookie access_token (el frontend borra su copia en localStorage)"""
+    resp = Response(status_code=status.HTTP_204_NO_CONTENT)
+    resp.raw_headers.append((b"set-cookie", b"access_token=; Max-Age=0; Path=/; SameSite=Lax"))
+    return resp
 
 @auth_router.get("/debug/config")
 async def auth_debug_config(request: Request):
@@ -202,78 +359,88 @@ async def auth_debug_config(request: Request):
     return {
         "host": host,
         "proto": proto,
-        "env_GOOGLE_REDIRECT_URI": os.getenv("GOOGLE_REDIRECT_URI"),
-        "env_PUBLIC_BASE_URL": os.getenv("PUBLIC_BASE_URL"),
+        "env_GOOGLE_REDIRECT_URI": _GOOGLE_REDIRECT or None,
+        "env_PUBLIC_BASE_URL": _PUBLIC_BASE or None,
         "default_service_redirect_uri": google_auth.redirect_uri,
         "suggested_frontend_callback": f"{proto}://{host}/auth/google/callback/redirect" if host else None,
         "suggested_backend_callback": f"{proto}://{host}/api/auth/google/callback/redirect" if host else None,
         "cookie_secure_example": (proto == 'https')
     }
 
+# Cabeceras que muestran los endpoints de debug (Starlette ya las entrega en minúsculas).
+# cookie/authorization se analizan aparte con preview, no se copian enteras.
+_DEBUG_HEADER_ALLOW = frozenset(("host", "x-forwarded-host", "x-original-host", "x-forwarded-proto", "origin", "referer", "user-agent"))
+
+def _preview(value: str, n: int = 50) -> str:
+    """Recorte para mostrar tokens/cabeceras en los endpoints de debug."""
+    return value if len(value) <= n else f"{value[:n]}..."
+
+def _is_bearer(auth_header: str) -> bool:
+    # Esquema Authorization insensible a mayúsculas (RFC 7235)
+    return auth_header[:7].lower() == "bearer "
+
 @auth_router.get("/debug/token")
 async def debug_token_check(request: Request):
     """Debug endpoint to check if token is being received correctly."""
+    if not AUTH_DEBUG:
+        raise HTTPException(status_code=404, detail="Not Found")
     auth_header = request.headers.get("authorization", "")
     cookie_token = request.cookies.get("access_token", "")
     
     return {
-        "auth_header": auth_header[:50] + "..." if auth_header else "None",
-        "cookie_token": cookie_token[:50] + "..." if cookie_token else "None",
-        "headers": dict(request.headers),
-        "cookies": dict(request.cookies)
+        "auth_header": _preview(auth_header) if auth_header else "None",
+        "cookie_token": _preview(cookie_token) if cookie_token else "None",
+        "headers": {k: v for k, v in request.headers.items() if k in _DEBUG_HEADER_ALLOW},
+        "cookies": list(request.cookies)
     }
 
+# Cuerpos 401 de /me serializados una vez (mismo cuerpo y cabecera que el HTTPException equivalente)
+_UNAUTHORIZED_BODY = _JSONResponse({"detail": "Token de acceso requerido"}).body
+_INVALID_TOKEN_BODY = _JSONResponse({"detail": "Token inválido"}).body
+
+def _unauthorized(body: bytes) -> Response:
+    return Response(content=body, status_code=status.HTTP_401_UNAUTHORIZED, media_type="application/json",
+                    headers={"WWW-Authenticate": "Bearer"})
+
 @auth_router.get("/me")
 async def get_current_user_info(request: Request):
     """Obtener información del usuario actual - con múltiples formas de autenticación"""
-    token = None
-    
-    # 1. Intentar desde Authorization header
-    auth_header = request.headers.get("authorization", "")
-    if auth_header.startswith("Bearer "):
-        token = auth_header[7:]
+    # 1. Authorization header; 2. si no hay, cookie (solo con AUTH_HTTPONLY_COOKIE, igual que get_current_user)
+    token = ((auth_header := request.headers.get("authorization")) and _is_bearer(auth_header) and auth_header[7:]) \
+        or (AUTH_HTTPONLY_COOKIE and request.cookies.get("access_token"))
     
-    # 2. Si no hay header, intentar desde cookie
     if not token:
-        token = request.cookies.get("access_token")
-    
-    if not token:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token de acceso requerido",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
+        return _unauthorized(_UNAUTHORIZED_BODY)
     
     try:
         # Verificar el token JWT
-        payload = google_auth.verify_jwt_token(token)
-        return {
+        payload = _verify_jwt(token)
+        # verify_jwt_token ya normaliza picture/subscription_tier/role con sus valores por defecto
+        tier = payload["subscription_tier"]
+        role = payload["role"]
+        # JSONResponse directo: el contenido ya es JSON-serializable, se evita jsonable_encoder
+        return _JSONResponse({
             "user": {
                 "id": payload["sub"],
                 "email": payload["email"], 
                 "name": payload["name"],
-                "picture": payload.get("picture", ""),
-                "subscription_tier": payload.get("subscription_tier", "free"),
-                "role": payload.get("role", "student")
+                "picture": payload["picture"],
+                "subscription_tier": tier,
+                "role": role
             },
-            "subscription_tier": payload.get("subscription_tier", "free"),
-            "role": payload.get("role", "student")
-        }
+            "subscription_tier": tier,
+            "role": role
+        })
     except Exception as e:
         logger.error(f"Error verificando token: {e}")
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token inválido",
-            headers={"WWW-Authenticate": "Bearer"}
-        )
+        return _unauthorized(_INVALID_TOKEN_BODY)
 
-@auth_router.get("/debug/auth")
-async def debug_auth_status(request: Request):
-    """Endpoint de debug para diagnosticar problemas de autenticación"""
+def _debug_auth_info(request: Request) -> Dict[str, Any]:
+    """Diagnóstico de cabecera/cookie/token usado por /debug/auth."""
     debug_info = {
         "timestamp": datetime.utcnow().isoformat(),
-        "request_headers": dict(request.headers),
-        "cookies": dict(request.cookies),
+        "request_headers": {k: v for k, v in request.headers.items() if k in _DEBUG_HEADER_ALLOW},
+        "cookies": list(request.cookies),
         "auth_analysis": {}
     }
     
@@ -281,9 +448,9 @@ async def debug_auth_status(request: Request):
     auth_header = request.headers.get("authorization", "")
     debug_info["auth_analysis"]["authorization_header"] = {
         "present": bool(auth_header),
-        "starts_with_bearer": auth_header.startswith("Bearer "),
+        "starts_with_bearer": _is_bearer(auth_header),
         "length": len(auth_header),
-        "preview": auth_header[:50] + "..." if len(auth_header) > 50 else auth_header
+        "preview": _preview(auth_header)
     }
     
     # Analizar cookie
@@ -291,14 +458,14 @@ async def debug_auth_status(request: Request):
     debug_info["auth_analysis"]["cookie_token"] = {
         "present": bool(cookie_token),
         "length": len(cookie_token) if cookie_token else 0,
-        "preview": cookie_token[:50] + "..." if cookie_token and len(cookie_token) > 50 else cookie_token
+        "preview": _preview(cookie_token) if cookie_token else cookie_token
     }
     
     # Intentar extraer token
     token = None
     token_source = None
     
-    if auth_header.startswith("Bearer "):
+    if _is_bearer(auth_header):
         token = auth_header[7:]
         token_source = "authorization_header"
     elif cookie_token:
@@ -309,13 +476,13 @@ async def debug_auth_status(request: Request):
         "token_found": bool(token),
         "token_source": token_source,
         "token_length": len(token) if token else 0,
-        "token_preview": token[:50] + "..." if token and len(token) > 50 else token
+        "token_preview": _preview(token) if token else token
     }
     
     # Si hay token, intentar verificarlo
     if token:
         try:
-            payload = google_auth.verify_jwt_token(token)
+            payload = _verify_jwt(token)
             debug_info["auth_analysis"]["token_verification"] = {
                 "status": "valid",
                 "payload_keys": list(payload.keys()) if payload else [],
@@ -337,6 +504,206 @@ async def debug_auth_status(request: Request):
     
     return debug_info
 
+@auth_router.get("/debug/auth")
+async def debug_auth_status(request: Request):
+    """Endpoint de debug para diagnosticar problemas de autenticación (solo con AUTH_DEBUG=1)"""
+    if not AUTH_DEBUG:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return _debug_auth_info(request)
+
+# Páginas de error estáticas: el HTML se codifica una vez al importar.
+# La Response se crea por petición porque los middlewares (CORS) modifican
+# sus cabeceras en el propio objeto y no se puede compartir entre peticiones.
+def _html_error(body: bytes, status_code: int) -> Response:
+    return Response(content=body, status_code=status_code, media_type="text/html")
+
+
+_ERR_AUTH_HTML = """<!DOCTYPE html>
+<html>
+<head>
+    <title>Error de Autenticación</title>
+    <style>
+        body { font-family: Arial, sans-serif; text-align: center; margin-top: 50px; }
+        .error { color: #d32f2f; background: #ffebee; padding: 20px; border-radius: 8px; max-width: 500px; margin: 0 auto; }
+    </style>
+</head>
+<body>
+    <div class="error">
+        <h2>Error de Autenticación</h2>
+        <p>Hubo un problema procesando su solicitud. Por favor intente de nuevo.</p>
+        <a href="/login">Volver al Login</a>
+    </div>
+</body>
+</html>""".encode()
+
+_ERR_MISSING_PARAMS_HTML = """<!DOCTYPE html>
+<html>
+<head><title>Error de Autenticación</title></head>
+<body>
+    <h2>Error de Autenticación</h2>
+    <p>Faltan parámetros requeridos para la autenticación.</p>
+    <a href="/login">Volver al Login</a>
+</body>
+</html>""".encode()
+
+_ERR_STATE_EXPIRED_HTML = """<!DOCTYPE html>
+<html>
+<head><title>Error de Autenticación</title></head>
+<body>
+    <h2>Error de Autenticación</h2>
+    <p>La sesión de autenticación ha expirado.</p>
+    <a href="/login">Volver al Login</a>
+</body>
+</html>""".encode()
+
+_ERR_UNEXPECTED_HTML = """<!DOCTYPE html>
+<html>
+<head><title>Error</title></head>
+<body>
+    <h2>Error</h2>
+    <p>Ha ocurrido un error inesperado.</p>
+    <a href="/login">Volver al Login</a>
+</body>
+</html>""".encode()
+
+_ERR_OAUTH_CONFIG_HTML = """<!DOCTYPE html>
+<html>
+<head><title>Error de Autenticación</title></head>
+<body>
+    <h2>Error de Autenticación</h2>
+    <p>No se pudo completar la autenticación con Google. Verifique la configuración OAuth.</p>
+    <a href="/login">Volver al Login</a>
+</body>
+</html>""".encode()
+
+_ERR_GOOGLE_AUTH_HTML = """<!DOCTYPE html>
+<html>
+<head><title>Error de Autenticación</title></head>
+<body>
+    <h2>Error de Autenticación</h2>
+    <p>Error durante la autenticación con Google.</p>
+    <a href="/login">Volver al Login</a>
+</body>
+</html>""".encode()
+
+_ERR_INTERNAL_HTML = """<!DOCTYPE html>
+<html>
+<head><title>Error de Autenticación</title></head>
+<body>
+    <h2>Error de Autenticación</h2>
+    <p>Error interno del servidor. Por favor intente de nuevo.</p>
+    <a href="/login">Volver al Login</a>
+</body>
+</html>""".encode()
+
+_ERR_REDIRECT_HTML = """<!DOCTYPE html>
+<html>
+<head>
+    <title>Error de Autenticación</title>
+</head>
+<body>
+    <h1>Error de Autenticación</h1>
+    <p>Hubo un problema procesando su solicitud de autenticación.</p>
+    <p><a href="/login">Intentar de nuevo</a></p>
+</body>
+</html>""".encode()
+
+# Páginas dinámicas de los callbacks (/auth/* y /api/auth/google/callback/redirect), Jinja2 compiladas una vez.
+# autoescape protege el HTML; dentro de <script> los valores van con |tojson.
+_OAUTH_SUCCESS_HTML = """<!DOCTYPE html>
+<html>
+<head>
+    <title>Autenticación Exitosa</title>
+    <script>
+        console.log('[OAuth] Storing token in localStorage');
+        // Almacenar token en localStorage
+        localStorage.setItem('access_token', {{ access_token|tojson }});
+        localStorage.setItem('user_data', JSON.stringify({{ user|tojson }}));
+
+        console.log('[OAuth] Token stored, redirecting to:', {{ redirect_url|tojson }});
+        // Redirigir al dashboard del frontend
+        window.location.href = {{ redirect_url|tojson }};
+    </script>
+</head>
+<body>
+    <p>Autenticación exitosa, redirigiendo...</p>
+</body>
+</html>"""
+
+_OAUTH_REDIRECT_SUCCESS_HTML = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <title>Login Exitoso</title>
+    <meta http-equiv="refresh" content="2;url={{ redirect_url }}">
+</head>
+<body>
+    <h2>✅ Autenticación exitosa</h2>
+    <p>Redirigiendo...</p>
+    <script>
+        // Guardar token de forma simple
+        localStorage.setItem('access_token', {{ access_token|tojson }});
+        // Redirigir inmediatamente
+        setTimeout(() => window.location.href = {{ redirect_url|tojson }}, 1000);
+    </script>
+</body>
+</html>"""
+
+# /google/callback/redirect: guarda el token (storage + cookie) y redirige
+_OAUTH_CALLBACK_STORE_HTML = """<!DOCTYPE html><html><head><meta charset='utf-8'><title>Autenticando...</title></head><body>
+<script>
+(function() {
+  try {
+    var token = {{ token|tojson }};
+    console.log('[Auth] Guardando token:', token.substring(0, 20) + '...');
+    localStorage.setItem('access_token', token);
+    sessionStorage.setItem('access_token', token);
+    document.cookie = 'access_token=' + token + '; Path=/; SameSite=Lax';
+    console.log('[Auth] Token guardado, redirigiendo a:', {{ redirect_url|tojson }});
+    
+    // Verificar que se guardó correctamente
+    var stored = localStorage.getItem('access_token');
+    if (stored === token) {
+      console.log('[Auth] Token verificado en localStorage');
+      setTimeout(function() {
+        window.location.replace({{ redirect_url|tojson }});
+      }, 100);
+    } else {
+      console.error('[Auth] Error: token no se guardó correctamente');
+      document.body.innerHTML = 'Error: token no se guardó correctamente';
+    }
+  } catch(e) {
+    console.error('[Auth] Error almacenando token:', e);
+    document.body.innerHTML = 'Error almacenando token: ' + e;
+    return;
+  }
+})();
+</script>
+<div>Guardando token y redirigiendo...</div>
+</body></html>"""
+
+_OAUTH_AUTH_ERROR_HTML = """<!DOCTYPE html>
+<html>
+<head><title>Error de Autenticación</title></head>
+<body>
+    <h2>Error de Autenticación</h2>
+    <p>No se pudo completar la autenticación: {{ error }}</p>
+    <a href="/login">Volver al Login</a>
+</body>
+</html>"""
+
+_OAUTH_TEMPLATES = {
+    "oauth_callback_store.html": _OAUTH_CALLBACK_STORE_HTML,
+    "oauth_success.html": _OAUTH_SUCCESS_HTML,
+    "oauth_redirect_success.html": _OAUTH_REDIRECT_SUCCESS_HTML,
+    "oauth_auth_error.html": _OAUTH_AUTH_ERROR_HTML,
+}
+
+_TEMPLATE_ENV = Environment(loader=DictLoader(_OAUTH_TEMPLATES), autoescape=True, auto_reload=False)
+
+def _render_page(name: str, **context: Any) -> str:
+    return _TEMPLATE_ENV.get_template(name).render(**context)
+
 @auth_router.get("/google/callback/redirect")
 async def google_callback_redirect(
     request: Request,
@@ -354,39 +721,21 @@ async def google_callback_redirect(
         
         # Add timeout and error handling for OAuth token exchange
         try:
-            auth_token = await google_auth.authenticate_with_google(code, redirect_override=chosen_redirect)
+            auth_token = await _authenticate_once(code, redirect_override=chosen_redirect)
         except HTTPException as he:
-            if 'redirect_uri' in str(getattr(he, 'detail', '')).lower():
+            if _is_redirect_mismatch(he):
                 logger.warning('[oauth] retry sin override por mismatch redirect_uri')
-                auth_token = await google_auth.authenticate_with_google(code, redirect_override=None)
+                auth_token = await _authenticate_once(code, redirect_override=None)
             else:
                 raise
         except Exception as e:
             logger.error(f"[OAuth] Error durante intercambio de token: {e}")
             # Return error page instead of raising exception to prevent 504
-            return HTMLResponse("""
-                <!DOCTYPE html>
-                <html>
-                <head>
-                    <title>Error de Autenticación</title>
-                    <style>
-                        body { font-family: Arial, sans-serif; text-align: center; margin-top: 50px; }
-                        .error { color: #d32f2f; background: #ffebee; padding: 20px; border-radius: 8px; max-width: 500px; margin: 0 auto; }
-                    </style>
-                </head>
-                <body>
-                    <div class="error">
-                        <h2>Error de Autenticación</h2>
-                        <p>Hubo un problema procesando su solicitud. Por favor intente de nuevo.</p>
-                        <a href="/login">Volver al Login</a>
-                    </div>
-                </body>
-                </html>
-            """, status_code=500)
+            return _html_error(_ERR_AUTH_HTML, 500)
         
         # Get frontend URL configuration
-        public_base = os.getenv("PUBLIC_BASE_URL", "").rstrip('/')
-        frontend_url = os.getenv("FRONTEND_URL")
+        public_base = _PUBLIC_BASE
+        frontend_url = _FRONTEND_URL
         
         if not frontend_url:
             if public_base:
@@ -398,77 +747,36 @@ async def google_callback_redirect(
         
         full_redirect_url = f"{frontend_url}{next_path}"
         
+        if AUTH_HTTPONLY_COOKIE:
+            # Solo cookie HttpOnly: el token no pasa por JS (ni localStorage ni document.cookie)
+            return _cookie_redirect(request, full_redirect_url, auth_token.access_token)
+        
         # Respuesta HTML que guarda el token y redirige
-        html = f"""<!DOCTYPE html><html><head><meta charset='utf-8'><title>Autenticando...</title></head><body>
-<script>
-(function() {{
-  try {{
-    var token = {auth_token.access_token!r};
-    console.log('[Auth] Guardando token:', token.substring(0, 20) + '...');
-    localStorage.setItem('access_token', token);
-    sessionStorage.setItem('access_token', token);
-    document.cookie = 'access_token=' + token + '; Path=/; SameSite=Lax';
-    console.log('[Auth] Token guardado, redirigiendo a:', {full_redirect_url!r});
-    
-    // Verificar que se guardó correctamente
-    var stored = localStorage.getItem('access_token');
-    if (stored === token) {{
-      console.log('[Auth] Token verificado en localStorage');
-      setTimeout(function() {{
-        window.location.replace({full_redirect_url!r});
-      }}, 100);
-    }} else {{
-      console.error('[Auth] Error: token no se guardó correctamente');
-      document.body.innerHTML = 'Error: token no se guardó correctamente';
-    }}
-  }} catch(e) {{
-    console.error('[Auth] Error almacenando token:', e);
-    document.body.innerHTML = 'Error almacenando token: ' + e;
-    return;
-  }}
-}})();
-</script>
-<div>Guardando token y redirigiendo...</div>
-</body></html>"""
+        body = _render_page("oauth_callback_store.html", token=auth_token.access_token, redirect_url=full_redirect_url)
         
         secure_flag = (request.headers.get('x-forwarded-proto') == 'https') or (request.url.scheme == 'https')
-        from datetime import timedelta
-        resp = HTMLResponse(html)
-        resp.set_cookie(
-            key="access_token",
-            value=auth_token.access_token,
-            max_age=int(timedelta(hours=24).total_seconds()),
-            httponly=False,
-            secure=secure_flag,
-            samesite="Lax",
-            path="/"
-        )
+        resp = Response(content=body, media_type="text/html")
+        resp.raw_headers.append((b"set-cookie", _access_cookie(auth_token.access_token, secure_flag)))
         return resp
         
     except Exception as e:
         logger.error(f"Error en callback redirect Google: {type(e).__name__}: {e}")
         # Return error page instead of raising exception
-        return HTMLResponse("""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Error de Autenticación</title>
-                <style>
-                    body { font-family: Arial, sans-serif; text-align: center; margin-top: 50px; }
-                    .error { color: #d32f2f; background: #ffebee; padding: 20px; border-radius: 8px; max-width: 500px; margin: 0 auto; }
-                </style>
-            </head>
-            <body>
-                <div class="error">
-                    <h2>Error de Autenticación</h2>
-                    <p>Hubo un problema procesando su solicitud. Por favor intente de nuevo.</p>
-                    <a href="/login">Volver al Login</a>
-                </div>
-            </body>
-            </html>
-        """, status_code=500)
+        return _html_error(_ERR_AUTH_HTML, 500)
 # ==================== ENDPOINTS DE SUSCRIPCIÓN ====================
 
+@lru_cache(maxsize=None)
+def _plan_dict(tier: SubscriptionTier) -> Dict[str, Any]:
+    """plan.dict() por tier: los planes son estáticos, se serializan una sola vez."""
+    return stripe_service.get_plan_features(tier).dict()
+
+# Respuesta de /status para usuarios sin suscripción (caso más frecuente)
+_FREE_STATUS_RESPONSE = {
+    "tier": SubscriptionTier.FREE,
+    "status": "active",
+    "plan": _plan_dict(SubscriptionTier.FREE)
+}
+
 @subscription_router.get("/status")
 async def get_subscription_status(current_user: Dict[str, Any] = Depends(get_current_user)):
     """Obtener estado actual de suscripción del usuario"""
@@ -477,29 +785,20 @@ async def get_subscription_status(current_user: Dict[str, Any] = Depends(get_cur
         subscription_id = current_user.get("subscription_id")
         
         if not subscription_id:
-            return {
-                "tier": SubscriptionTier.FREE,
-                "status": "active",
-                "plan": stripe_service.get_plan_features(SubscriptionTier.FREE).dict()
-            }
+            return _FREE_STATUS_RESPONSE
         
         subscription = await stripe_service.get_subscription(subscription_id)
         
         if subscription:
-            plan = stripe_service.get_plan_features(subscription["tier"])
             return {
                 "tier": subscription["tier"],
                 "status": subscription["status"],
                 "current_period_end": subscription["current_period_end"],
                 "cancel_at_period_end": subscription.get("cancel_at_period_end", False),
-                "plan": plan.dict()
+                "plan": _plan_dict(subscription["tier"])
             }
         else:
-            return {
-                "tier": SubscriptionTier.FREE,
-                "status": "active",
-                "plan": stripe_service.get_plan_features(SubscriptionTier.FREE).dict()
-            }
+            return _FREE_STATUS_RESPONSE
             
     except Exception as e:
         logger.error(f"Error obteniendo suscripción: {e}")
@@ -518,11 +817,9 @@ async def create_checkout_session(
         if not plan:
             raise HTTPException(status_code=400, detail="Plan no válido")
         
-        # Obtener price_id según el período de facturación
-        if billing_period == "yearly":
-            price_id = plan.stripe_price_id_yearly
-        else:
-            price_id = plan.stripe_price_id_monthly
+        # Obtener price_id según el período de facturación (mensual por defecto)
+        prices = stripe_service.price_ids[tier]
+        price_id = prices.get(billing_period, prices["monthly"])
         
         if not price_id:
             raise HTTPException(status_code=400, detail="Plan no disponible para compra")
@@ -544,8 +841,8 @@ async def create_checkout_session(
         session = await stripe_service.create_checkout_session(
             customer_id=customer_id,
             price_id=price_id,
-            success_url=f"{os.getenv('FRONTEND_URL', 'http://localhost:3000')}/subscription/success?session_id={{CHECKOUT_SESSION_ID}}",
-            cancel_url=f"{os.getenv('FRONTEND_URL', 'http://localhost:3000')}/subscription/cancel",
+            success_url=f"{_FRONTEND_URL or 'http://localhost:3000'}/subscription/success?session_id={{CHECKOUT_SESSION_ID}}",
+            cancel_url=f"{_FRONTEND_URL or 'http://localhost:3000'}/subscription/cancel",
             metadata={
                 "user_id": current_user["sub"],
                 "tier": tier.value
@@ -590,11 +887,13 @@ async def cancel_subscription(
 
 @subscription_router.post("/webhook")
 async def stripe_webhook(request: Request):
-    """Webhook de Stripe para eventos de suscripción"""
+    """Webhook de Stripe para eventos de suscripción.
+    El evento se procesa antes de responder: si falla, Stripe recibe 400 y reintenta."""
     try:
         payload = await request.body()
         signature = request.headers.get("stripe-signature")
         
+        # handle_webhook verifica la firma en un hilo y luego procesa el evento
         result = await stripe_service.handle_webhook(payload, signature)
         
         return {"status": "success", "result": result}
@@ -642,380 +941,114 @@ async def get_usage_stats(current_user: Dict[str, Any] = Depends(get_current_use
 
 # ==================== ENDPOINTS DE REDIRECCIÓN OAUTH ====================
 
-@oauth_redirect_router.get("/callback")
-async def oauth_callback_handler(request: Request, state: str = None, code: str = None):
-    """
-    Endpoint estándar para el callback de Google OAuth - /auth/callback
-    Este es el endpoint que Google espera según la configuración GOOGLE_REDIRECT_URI
-    """
-    try:
-        logger.info(f"[OAuth] Callback capturado en /auth/callback")
-        logger.info(f"[OAuth] State: {state}, Code: {code[:20]}..." if code else "No code")
-        
-        # Procesar el callback directamente aquí
-        if not state or not code:
-            logger.error("[OAuth] Faltan parámetros state o code")
-            return HTMLResponse("""
-                <!DOCTYPE html>
-                <html>
-                <head><title>Error de Autenticación</title></head>
-                <body>
-                    <h2>Error de Autenticación</h2>
-                    <p>Faltan parámetros requeridos para la autenticación.</p>
-                    <a href="/login">Volver al Login</a>
-                </body>
-                </html>
-            """, status_code=400)
-
-        # Parsear y validar state
-        state_data = _parse_state(state)
-        if not state_data:
-            logger.error("[OAuth] State inválido o expirado")
-            return HTMLResponse("""
-                <!DOCTYPE html>
-                <html>
-                <head><title>Error de Autenticación</title></head>
-                <body>
-                    <h2>Error de Autenticación</h2>
-                    <p>La sesión de autenticación ha expirado.</p>
-                    <a href="/login">Volver al Login</a>
-                </body>
-                </html>
-            """, status_code=400)
-        
-        redirect_to = state_data.get("n", "/")
-        
-        # Autenticar con Google usando el redirect URI correcto
-        try:
-            # Use the /auth/google/callback/redirect redirect URI that matches login generation
-            public_base = os.getenv("PUBLIC_BASE_URL", "").rstrip('/')
-            if public_base:
-                correct_redirect_uri = f"{public_base}/auth/google/callback/redirect"
-            else:
-                host = request.headers.get("x-forwarded-host") or request.url.hostname or ""
-                proto = request.headers.get("x-forwarded-proto") or request.url.scheme or 'https'
-                correct_redirect_uri = f"{proto}://{host}/auth/google/callback/redirect"
-                
-            logger.info(f"[OAuth] Intentando autenticación con redirect_uri: {correct_redirect_uri}")
-            auth_token = await google_auth.authenticate_with_google(code, redirect_override=correct_redirect_uri)
-            
-            # Generar HTML de respuesta que almacena el token y redirige al frontend
-            frontend_domain = "https://educational-api.kindbeach-3a240fb9.eastus.azurecontainerapps.io"
-            user_data_json = json.dumps(auth_token.user).replace("'", "\\'")
-            html_response = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Autenticación Exitosa</title>
-                <script>
-                    console.log('[OAuth] Storing token in localStorage');
-                    // Almacenar token en localStorage
-                    localStorage.setItem('access_token', '{auth_token.access_token}');
-                    localStorage.setItem('user_data', '{user_data_json}');
-                    
-                    console.log('[OAuth] Token stored, redirecting to:', '{frontend_domain}{redirect_to}');
-                    // Redirigir al dashboard del frontend
-                    window.location.href = '{frontend_domain}{redirect_to}';
-                </script>
-            </head>
-            <body>
-                <p>Autenticación exitosa, redirigiendo...</p>
-            </body>
-            </html>
-            """
-            
-            return HTMLResponse(html_response)
-            
-        except Exception as auth_error:
-            logger.error(f"[OAuth] Error de autenticación: {auth_error}")
-            return HTMLResponse(f"""
-                <!DOCTYPE html>
-                <html>
-                <head><title>Error de Autenticación</title></head>
-                <body>
-                    <h2>Error de Autenticación</h2>
-                    <p>No se pudo completar la autenticación: {str(auth_error)}</p>
-                    <a href="/login">Volver al Login</a>
-                </body>
-                </html>
-            """, status_code=400)
-            
-    except Exception as e:
-        logger.error(f"[OAuth] Error en callback: {e}")
-        return HTMLResponse("""
-            <!DOCTYPE html>
-            <html>
-            <head><title>Error</title></head>
-            <body>
-                <h2>Error</h2>
-                <p>Ha ocurrido un error inesperado.</p>
-                <a href="/login">Volver al Login</a>
-            </body>
-            </html>
-        """, status_code=500)
+# Dominio al que vuelven los callbacks /auth/callback y /auth/google/callback
+_OAUTH_FRONTEND_DOMAIN = "https://educational-api.kindbeach-3a240fb9.eastus.azurecontainerapps.io"
 
-@oauth_redirect_router.get("/google/callback")
-async def oauth_google_callback_handler(request: Request, state: str = None, code: str = None):
-    """
-    Endpoint específico para Google OAuth callback - /auth/google/callback
-    Este endpoint maneja redirecciones desde Google cuando está configurado así
-    """
+async def _process_oauth_callback(request: Request, state: Optional[str], code: Optional[str],
+                                  callback_suffix: str, direct_redirect: bool = False):
+    """Flujo común de los callbacks /auth/*: valida el state, intercambia el code y responde con HTML.
+    callback_suffix es la ruta del redirect_uri usado al generar el login. direct_redirect activa el
+    reintento sin override, las páginas de error específicas y la redirección al host actual."""
     try:
-        logger.info(f"[OAuth] Google callback capturado en /auth/google/callback")
+        logger.info(f"[OAuth] Callback capturado en {request.url.path}")
         logger.info(f"[OAuth] State: {state}, Code: {code[:20]}..." if code else "No code")
         
-        # Procesar el callback directamente aquí
         if not state or not code:
             logger.error("[OAuth] Faltan parámetros state o code")
-            return HTMLResponse("""
-                <!DOCTYPE html>
-                <html>
-                <head><title>Error de Autenticación</title></head>
-                <body>
-                    <h2>Error de Autenticación</h2>
-                    <p>Faltan parámetros requeridos para la autenticación.</p>
-                    <a href="/login">Volver al Login</a>
-                </body>
-                </html>
-            """, status_code=400)
+            return _html_error(_ERR_MISSING_PARAMS_HTML, 400)
 
         # Parsear y validar state
         state_data = _parse_state(state)
         if not state_data:
             logger.error("[OAuth] State inválido o expirado")
-            return HTMLResponse("""
-                <!DOCTYPE html>
-                <html>
-                <head><title>Error de Autenticación</title></head>
-                <body>
-                    <h2>Error de Autenticación</h2>
-                    <p>La sesión de autenticación ha expirado.</p>
-                    <a href="/login">Volver al Login</a>
-                </body>
-                </html>
-            """, status_code=400)
+            return _html_error(_ERR_STATE_EXPIRED_HTML, 400)
         
         redirect_to = state_data.get("n", "/")
         
-        # Autenticar con Google usando el redirect URI correcto
+        # Autenticar con Google usando el mismo redirect URI con el que se generó el login
+        correct_redirect_uri = _PUBLIC_CALLBACK_URIS.get(callback_suffix)
         try:
-            # Use the correct redirect URI for Google callback
-            public_base = os.getenv("PUBLIC_BASE_URL", "").rstrip('/')
-            if public_base:
-                correct_redirect_uri = f"{public_base}/auth/google/callback"
-            else:
+            if correct_redirect_uri is None:
                 host = request.headers.get("x-forwarded-host") or request.url.hostname or ""
                 proto = request.headers.get("x-forwarded-proto") or request.url.scheme or 'https'
-                correct_redirect_uri = f"{proto}://{host}/auth/google/callback"
+                correct_redirect_uri = f"{proto}://{host}{callback_suffix}"
                 
             logger.info(f"[OAuth] Intentando autenticación con redirect_uri: {correct_redirect_uri}")
-            auth_token = await google_auth.authenticate_with_google(code, redirect_override=correct_redirect_uri)
-            
-            # Generar HTML de respuesta que almacena el token y redirige al frontend
-            frontend_domain = "https://educational-api.kindbeach-3a240fb9.eastus.azurecontainerapps.io"
-            user_data_json = json.dumps(auth_token.user).replace("'", "\\'")
-            html_response = f"""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Autenticación Exitosa</title>
-                <script>
-                    console.log('[OAuth] Storing token in localStorage');
-                    // Almacenar token en localStorage
-                    localStorage.setItem('access_token', '{auth_token.access_token}');
-                    localStorage.setItem('user_data', '{user_data_json}');
-                    
-                    console.log('[OAuth] Token stored, redirecting to:', '{frontend_domain}{redirect_to}');
-                    // Redirigir al dashboard del frontend
-                    window.location.href = '{frontend_domain}{redirect_to}';
-                </script>
-            </head>
-            <body>
-                <p>Autenticación exitosa, redirigiendo...</p>
-            </body>
-            </html>
-            """
-            
-            return HTMLResponse(html_response)
-            
-        except Exception as auth_error:
-            logger.error(f"[OAuth] Error de autenticación: {auth_error}")
-            return HTMLResponse(f"""
-                <!DOCTYPE html>
-                <html>
-                <head><title>Error de Autenticación</title></head>
-                <body>
-                    <h2>Error de Autenticación</h2>
-                    <p>No se pudo completar la autenticación: {str(auth_error)}</p>
-                    <a href="/login">Volver al Login</a>
-                </body>
-                </html>
-            """, status_code=400)
-            
-    except Exception as e:
-        logger.error(f"[OAuth] Error en google callback: {e}")
-        return HTMLResponse("""
-            <!DOCTYPE html>
-            <html>
-            <head><title>Error</title></head>
-            <body>
-                <h2>Error</h2>
-                <p>Ha ocurrido un error inesperado.</p>
-                <a href="/login">Volver al Login</a>
-            </body>
-            </html>
-        """, status_code=500)
-
-@oauth_redirect_router.get("/google/callback/redirect")
-async def oauth_redirect_handler(request: Request, state: str = None, code: str = None):
-    """
-    Endpoint para manejar redirecciones de OAuth que lleguen sin el prefijo /api
-    Procesa directamente el callback en lugar de crear un loop de redirecciones
-    """
-    try:
-        logger.info(f"[OAuth] Callback directo capturado en /auth/google/callback/redirect")
-        logger.info(f"[OAuth] State: {state}, Code: {code[:20]}..." if code else "No code")
-        
-        # Procesar el callback directamente aquí usando la misma lógica del endpoint /api
-        if not state or not code:
-            logger.error("[OAuth] Faltan parámetros state o code")
-            return HTMLResponse("""
-                <!DOCTYPE html>
-                <html>
-                <head><title>Error de Autenticación</title></head>
-                <body>
-                    <h2>Error de Autenticación</h2>
-                    <p>Faltan parámetros requeridos para la autenticación.</p>
-                    <a href="/login">Volver al Login</a>
-                </body>
-                </html>
-            """, status_code=400)
-
-        # Parsear y validar state
-        state_data = _parse_state(state)
-        if not state_data:
-            logger.error("[OAuth] State inválido o expirado")
-            return HTMLResponse("""
-                <!DOCTYPE html>
-                <html>
-                <head><title>Error de Autenticación</title></head>
-                <body>
-                    <h2>Error de Autenticación</h2>
-                    <p>La sesión de autenticación ha expirado.</p>
-                    <a href="/login">Volver al Login</a>
-                </body>
-                </html>
-            """, status_code=400)
-        
-        redirect_to = state_data.get("n", "/")
-        
-        # Autenticar con Google usando el código
-        # Use the correct redirect URI that matches what Google expects
-        correct_redirect_uri = None
-        try:
-            # First try with the URI Google actually redirected to
-            public_base = os.getenv("PUBLIC_BASE_URL", "").rstrip('/')
-            if public_base:
-                correct_redirect_uri = f"{public_base}/auth/google/callback/redirect"
-            else:
-                host = request.headers.get("x-forwarded-host") or request.url.hostname or ""
-                proto = request.headers.get("x-forwarded-proto") or request.url.scheme or 'https'
-                correct_redirect_uri = f"{proto}://{host}/auth/google/callback/redirect"
-                
-            logger.info(f"[OAuth] Intentando autenticación con redirect_uri: {correct_redirect_uri}")
-            auth_token = await google_auth.authenticate_with_google(code, redirect_override=correct_redirect_uri)
+            auth_token = await _authenticate_once(code, redirect_override=correct_redirect_uri)
             
         except HTTPException as he:
+            if not direct_redirect:
+                logger.error(f"[OAuth] Error de autenticación: {he}")
+                return HTMLResponse(_render_page("oauth_auth_error.html", error=str(he)), status_code=400)
             logger.warning(f"[OAuth] Error con redirect_uri {correct_redirect_uri}: {he.detail}")
-            if 'redirect_uri' in str(getattr(he, 'detail', '')).lower():
+            if _is_redirect_mismatch(he):
                 logger.warning('[OAuth] Retry sin override por mismatch redirect_uri')
                 try:
-                    auth_token = await google_auth.authenticate_with_google(code, redirect_override=None)
+                    auth_token = await _authenticate_once(code, redirect_override=None)
                 except Exception as e2:
                     logger.error(f"[OAuth] Falló también sin override: {e2}")
-                    return HTMLResponse("""
-                        <!DOCTYPE html>
-                        <html>
-                        <head><title>Error de Autenticación</title></head>
-                        <body>
-                            <h2>Error de Autenticación</h2>
-                            <p>No se pudo completar la autenticación con Google. Verifique la configuración OAuth.</p>
-                            <a href="/login">Volver al Login</a>
-                        </body>
-                        </html>
-                    """, status_code=400)
+                    return _html_error(_ERR_OAUTH_CONFIG_HTML, 400)
             else:
                 logger.error(f"[OAuth] Error de autenticación: {he.detail}")
-                return HTMLResponse("""
-                    <!DOCTYPE html>
-                    <html>
-                    <head><title>Error de Autenticación</title></head>
-                    <body>
-                        <h2>Error de Autenticación</h2>
-                        <p>Error durante la autenticación con Google.</p>
-                        <a href="/login">Volver al Login</a>
-                    </body>
-                    </html>
-                """, status_code=400)
-        except Exception as e:
-            logger.error(f"[OAuth] Error inesperado durante autenticación: {e}")
-            return HTMLResponse("""
-                <!DOCTYPE html>
-                <html>
-                <head><title>Error de Autenticación</title></head>
-                <body>
-                    <h2>Error de Autenticación</h2>
-                    <p>Error interno del servidor. Por favor intente de nuevo.</p>
-                    <a href="/login">Volver al Login</a>
-                </body>
-                </html>
-            """, status_code=500)
+                return _html_error(_ERR_GOOGLE_AUTH_HTML, 400)
+        except Exception as auth_error:
+            if not direct_redirect:
+                logger.error(f"[OAuth] Error de autenticación: {auth_error}")
+                return HTMLResponse(_render_page("oauth_auth_error.html", error=str(auth_error)), status_code=400)
+            logger.error(f"[OAuth] Error inesperado durante autenticación: {auth_error}")
+            return _html_error(_ERR_INTERNAL_HTML, 500)
         
         logger.info(f"[OAuth] Usuario autenticado exitosamente")
         
+        if not direct_redirect:
+            if AUTH_HTTPONLY_COOKIE:
+                return _cookie_redirect(request, f"{_OAUTH_FRONTEND_DOMAIN}{redirect_to}", auth_token.access_token)
+            # HTML que almacena el token y datos de usuario y redirige al frontend
+            return HTMLResponse(_render_page(
+                "oauth_success.html",
+                access_token=auth_token.access_token,
+                user=auth_token.user,
+                redirect_url=f"{_OAUTH_FRONTEND_DOMAIN}{redirect_to}"
+            ))
+        
         # Simplificar: usar dominio actual y redirección básica
         host = request.headers.get("x-forwarded-host") or request.url.hostname or ""
         proto = request.headers.get("x-forwarded-proto") or request.url.scheme or 'https'
-        base_url = f"{proto}://{host}"
-        full_redirect_url = f"{base_url}{redirect_to}"
+        full_redirect_url = f"{proto}://{host}{redirect_to}"
         
         logger.info(f"[OAuth] Redirigiendo a: {full_redirect_url}")
-        
-        # HTML simplificado para evitar timeouts
-        html_content = f"""<!DOCTYPE html>
-<html>
-<head>
-    <meta charset="utf-8">
-    <title>Login Exitoso</title>
-    <meta http-equiv="refresh" content="2;url={full_redirect_url}">
-</head>
-<body>
-    <h2>✅ Autenticación exitosa</h2>
-    <p>Redirigiendo...</p>
-    <script>
-        // Guardar token de forma simple
-        localStorage.setItem('access_token', {auth_token.access_token!r});
-        // Redirigir inmediatamente
-        setTimeout(() => window.location.href = {full_redirect_url!r}, 1000);
-    </script>
-</body>
-</html>"""
-
-        logger.info(f"[OAuth] Enviando respuesta HTML simplificada")
-        return HTMLResponse(content=html_content)
+        if AUTH_HTTPONLY_COOKIE:
+            return _cookie_redirect(request, full_redirect_url, auth_token.access_token)
+        return HTMLResponse(_render_page(
+            "oauth_redirect_success.html",
+            access_token=auth_token.access_token,
+            redirect_url=full_redirect_url
+        ))
         
     except Exception as e:
-        logger.error(f"[OAuth] Error en redirección: {e}")
-        return HTMLResponse("""
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>Error de Autenticación</title>
-            </head>
-            <body>
-                <h1>Error de Autenticación</h1>
-                <p>Hubo un problema procesando su solicitud de autenticación.</p>
-                <p><a href="/login">Intentar de nuevo</a></p>
-            </body>
-            </html>
-        """, status_code=500)
\ No newline at end of file
+        logger.error(f"[OAuth] Error en callback {request.url.path}: {e}")
+        return _html_error(_ERR_REDIRECT_HTML if direct_redirect else _ERR_UNEXPECTED_HTML, 500)
+
+@oauth_redirect_router.get("/callback")
+async def oauth_callback_handler(request: Request, state: str = None, code: str = None):
+    """
+    Endpoint estándar para el callback de Google OAuth - /auth/callback
+    Este es el endpoint que Google espera según la configuración GOOGLE_REDIRECT_URI
+    """
+    return await _process_oauth_callback(request, state, code, _CB_REDIRECT_PATH)
+
+@oauth_redirect_router.get("/google/callback")
+async def oauth_google_callback_handler(request: Request, state: str = None, code: str = None):
+    """
+    Endpoint específico para Google OAuth callback - /auth/google/callback
+    Este endpoint maneja redirecciones desde Google cuando está configurado así
+    """
+    return await _process_oauth_callback(request, state, code, _CB_PATH)
+
+@oauth_redirect_router.get("/google/callback/redirect")
+async def oauth_redirect_handler(request: Request, state: str = None, code: str = None):
+    """
+    Endpoint para manejar redirecciones de OAuth que lleguen sin el prefijo /api
+    Procesa directamente el callback en lugar de crear un loop de redirecciones
+    """
+    return await _process_oauth_callback(request, state, code, _CB_REDIRECT_PATH, direct_redirect=True)
@@ -3,13 +3,19 @@ Sistema de autenticación con Google OAuth 2.0
 """
 
 import os
+import re
+import hmac
+import json
+import time
+import base64
 import jwt
 import httpx
 import logging
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
-from fastapi import HTTPException, Depends, status
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from enum import IntEnum
+from functools import lru_cache
+from urllib.parse import quote, urlencode
+from typing import Dict, Any, Optional, Tuple
+from fastapi import HTTPException, Depends, Request, status
 from pydantic import BaseModel
 import secrets
 import hashlib
@@ -21,20 +27,137 @@ logger = logging.getLogger(__name__)
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET", "")
 GOOGLE_REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8000/auth/callback")
-JWT_SECRET = os.getenv("JWT_SECRET", secrets.token_urlsafe(32))
+# Secreto aleatorio solo si no está configurado (se genera una vez, al importar)
+JWT_SECRET = os.getenv("JWT_SECRET") or secrets.token_urlsafe(32)
 JWT_ALGORITHM = "HS256"
+# Con AUTH_HTTPONLY_COOKIE=1 la sesión viaja en la cookie HttpOnly access_token (y se acepta en
+# get_current_user); sin él solo vale la cabecera Authorization, la cookie legible por JS no autentica
+AUTH_HTTPONLY_COOKIE = os.getenv("AUTH_HTTPONLY_COOKIE", "").lower() in ("1", "true")
 JWT_EXPIRATION_HOURS = 24
-TEACHER_EMAILS = {
+JWT_EXPIRATION_SECONDS = JWT_EXPIRATION_HOURS * 3600
+JWT_SECRET_BYTES = JWT_SECRET.encode()
+TEACHER_EMAILS = frozenset(
     e.strip().lower() for e in os.getenv("TEACHER_EMAILS", "").split(",") if e.strip()
-}
+)
 
 # URLs de Google OAuth
 GOOGLE_AUTH_URL = "https://accounts.google.com/o/oauth2/v2/auth"
 GOOGLE_TOKEN_URL = "https://oauth2.googleapis.com/token"
 GOOGLE_USERINFO_URL = "https://www.googleapis.com/oauth2/v1/userinfo"
+GOOGLE_CERTS_URL = "https://www.googleapis.com/oauth2/v3/certs"
+GOOGLE_ISSUERS = ("https://accounts.google.com", "accounts.google.com")
 
-# Security
-security = HTTPBearer()
+# orjson es opcional: parseo/serialización JSON en C (dumps devuelve bytes)
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+    _JSON_COMPACT = json.JSONEncoder(separators=(",", ":"))
+
+    def _json_dumps(obj: Any) -> bytes:
+        return _JSON_COMPACT.encode(obj).encode()
+
+# HTTP/2 requiere el paquete opcional 'h2' (httpx[http2])
+try:
+    import h2  # noqa: F401
+    _HTTP2 = True
+except ImportError:
+    _HTTP2 = False
+
+# Cliente HTTP compartido: reutiliza conexiones keep-alive con Google entre logins
+_HTTPX = httpx.AsyncClient(
+    timeout=5.0,
+    http2=_HTTP2,
+    limits=httpx.Limits(max_keepalive_connections=32),
+)
+
+# JWKS de Google por 'kid', válido hasta _JWKS_EXPIRY (max-age de Cache-Control)
+_JWKS_CACHE: Dict[str, str] = {}
+_JWKS_EXPIRY: float = 0.0
+_JWKS_DEFAULT_TTL = 3600
+_MAX_AGE_RE = re.compile(r"max-age=(\d+)")
+
+async def _google_jwks(force: bool = False) -> Dict[str, str]:
+    """Claves públicas de Google (kid -> JWK en JSON), descargadas solo al expirar"""
+    global _JWKS_CACHE, _JWKS_EXPIRY
+    if not force and time.time() < _JWKS_EXPIRY:
+        return _JWKS_CACHE
+    response = await _HTTPX.get(GOOGLE_CERTS_URL)
+    response.raise_for_status()
+    m = _MAX_AGE_RE.search(response.headers.get("cache-control", ""))
+    _JWKS_CACHE = {k["kid"]: json.dumps(k) for k in _json_loads(response.content)["keys"]}
+    _JWKS_EXPIRY = time.time() + (int(m.group(1)) if m else _JWKS_DEFAULT_TTL)
+    return _JWKS_CACHE
+
+@lru_cache(maxsize=16)
+def _jwk_public_key(jwk_json: str):
+    """Materializar la clave RSA de un JWK una sola vez"""
+    return jwt.algorithms.RSAAlgorithm.from_jwk(jwk_json)
+
+# JWT HS256 propio con hmac/hashlib (C): evita el despacho genérico de PyJWT en cada petición.
+# Los tokens son compatibles con PyJWT en ambos sentidos.
+_JWT_HEADER_B64 = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b"=")
+
+def _b64url_decode(segment: bytes) -> bytes:
+    return base64.urlsafe_b64decode(segment + b"=" * (-len(segment) % 4))
+
+# HMAC con la clave ya preparada (ipad/opad calculados una vez); cada firma parte de una copia
+_JWT_HMAC = hmac.new(JWT_SECRET_BYTES, digestmod=hashlib.sha256)
+
+def _jwt_sign(signing_input: bytes) -> bytes:
+    h = _JWT_HMAC.copy()
+    h.update(signing_input)
+    return h.digest()
+
+def _jwt_encode(payload: Dict[str, Any]) -> str:
+    signing_input = _JWT_HEADER_B64 + b"." + base64.urlsafe_b64encode(_json_dumps(payload)).rstrip(b"=")
+    signature = _jwt_sign(signing_input)
+    return (signing_input + b"." + base64.urlsafe_b64encode(signature).rstrip(b"=")).decode()
+
+def _jwt_decode(token: str) -> Dict[str, Any]:
+    """Verificar firma HS256 y exp/nbf; lanza las mismas excepciones que jwt.decode"""
+    try:
+        signing_input, _, signature = token.encode("ascii").rpartition(b".")
+        header, _, body = signing_input.partition(b".")
+        if not header or not body or b"." in body:
+            raise ValueError
+        if header != _JWT_HEADER_B64 and _json_loads(_b64url_decode(header)).get("alg") != JWT_ALGORITHM:
+            raise ValueError
+        expected = _jwt_sign(signing_input)
+        if not hmac.compare_digest(expected, _b64url_decode(signature)):
+            raise jwt.InvalidSignatureError("Firma inválida")
+        payload = _json_loads(_b64url_decode(body))
+        if not isinstance(payload, dict):
+            raise ValueError
+    except jwt.InvalidTokenError:
+        raise
+    except Exception:
+        raise jwt.DecodeError("Token mal formado")
+    now = time.time()
+    exp = payload.get("exp")
+    if exp is not None:
+        if not isinstance(exp, (int, float)):
+            raise jwt.DecodeError("exp inválido")
+        if exp <= now:
+            raise jwt.ExpiredSignatureError("Token expirado")
+    nbf = payload.get("nbf")
+    if isinstance(nbf, (int, float)) and nbf > now:
+        raise jwt.ImmatureSignatureError("Token aún no válido")
+    return payload
+
+@lru_cache(maxsize=64)
+def _auth_url_prefix(client_id: str, redirect_uri: str) -> str:
+    """Parte fija (ya codificada) de la URL de autorización; solo 'state' varía por login"""
+    return f"{GOOGLE_AUTH_URL}?" + urlencode({
+        "client_id": client_id,
+        "redirect_uri": redirect_uri,
+        "response_type": "code",
+        "scope": "openid email profile",
+        "access_type": "offline",
+        "prompt": "consent"
+    })
 
 class GoogleUser(BaseModel):
     """Modelo de usuario de Google"""
@@ -45,14 +168,44 @@ class GoogleUser(BaseModel):
     verified_email: bool
     locale: Optional[str] = None
 
+class GoogleTokenError(HTTPException):
+    """Fallo del intercambio de código; error es el código OAuth de Google (p. ej. redirect_uri_mismatch)"""
+    def __init__(self, error: Optional[str] = None):
+        super().__init__(status_code=status.HTTP_400_BAD_REQUEST, detail="Error obteniendo token de Google")
+        self.error = error
+
 class AuthToken(BaseModel):
     """Token de autenticación"""
     access_token: str
     token_type: str = "bearer"
-    expires_in: int = JWT_EXPIRATION_HOURS * 3600
+    expires_in: int = JWT_EXPIRATION_SECONDS
     refresh_token: Optional[str] = None
     user: Dict[str, Any]
 
+# Payloads de JWT ya verificados, por hash del token (no el token en claro). Cada entrada vale
+# JWT_CACHE_TTL segundos como máximo y nunca más allá de su 'exp'. Los fallos no se cachean.
+# Solo se usa desde el event loop, así que no necesita lock.
+JWT_CACHE_TTL = float(os.getenv("JWT_CACHE_TTL", "30"))
+JWT_CACHE_MAX = int(os.getenv("JWT_CACHE_MAX", "10000"))
+_JWT_CACHE: Dict[bytes, Tuple[float, Dict[str, Any]]] = {}
+
+def _cache_jwt_payload(key: bytes, payload: Dict[str, Any], now: float) -> None:
+    if JWT_CACHE_TTL <= 0:
+        return
+    if len(_JWT_CACHE) >= JWT_CACHE_MAX:
+        for k in [k for k, (until, _) in _JWT_CACHE.items() if until <= now]:
+            del _JWT_CACHE[k]
+        if len(_JWT_CACHE) >= JWT_CACHE_MAX:
+            _JWT_CACHE.clear()
+    exp = payload.get("exp")
+    until = now + JWT_CACHE_TTL
+    if isinstance(exp, (int, float)) and exp < until:
+        until = exp
+    _JWT_CACHE[key] = (until, payload)
+
+# El aviso de configuración incompleta se emite una sola vez por proceso
+_CONFIG_WARNED = False
+
 class GoogleAuthService:
     """Servicio de autenticación con Google"""
     
@@ -61,87 +214,109 @@ class GoogleAuthService:
         self.client_secret = GOOGLE_CLIENT_SECRET
         self.redirect_uri = GOOGLE_REDIRECT_URI
         
-        if not self.client_id or not self.client_secret:
+        global _CONFIG_WARNED
+        if (not self.client_id or not self.client_secret) and not _CONFIG_WARNED:
+            _CONFIG_WARNED = True
             logger.warning("⚠️ Google OAuth no configurado correctamente")
     
     def get_authorization_url(self, state: str = None, redirect_override: Optional[str] = None) -> str:
         """Obtener URL de autorización de Google.
         redirect_override permite forzar un redirect_uri dinámico (ej: dominio productivo) sin mutar estado global."""
         if not state:
-            state = secrets.token_urlsafe(32)
+            # 16 bytes = 128 bits de entropía, suficiente para un state anti-CSRF
+            state = secrets.token_urlsafe(16)
 
         redirect_uri = redirect_override or self.redirect_uri
         if redirect_override and redirect_override != self.redirect_uri:
             # Log informativo para depurar diferencias de entorno
             logger.info(f"🔄 Usando redirect_uri dinámico (override) {redirect_override} (base default: {self.redirect_uri})")
 
-        params = {
-            "client_id": self.client_id,
-            "redirect_uri": redirect_uri,
-            "response_type": "code",
-            "scope": "openid email profile",
-            "access_type": "offline",
-            "state": state,
-            "prompt": "consent"
-        }
-
-        query_string = "&".join([f"{k}={v}" for k, v in params.items()])
-        return f"{GOOGLE_AUTH_URL}?{query_string}"
+        return f"{_auth_url_prefix(self.client_id, redirect_uri)}&state={quote(state, safe='')}"
     
     async def exchange_code_for_token(self, code: str, redirect_override: Optional[str] = None) -> Dict[str, Any]:
         """Intercambiar código de autorización por token.
         redirect_override permite usar el mismo override utilizado al generar la URL de autorización."""
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                GOOGLE_TOKEN_URL,
-                data={
-                    "code": code,
-                    "client_id": self.client_id,
-                    "client_secret": self.client_secret,
-                    "redirect_uri": redirect_override or self.redirect_uri,
-                    "grant_type": "authorization_code"
-                }
-            )
-            
-            if response.status_code != 200:
-                # Log detallado para depuración (NO incluye secrets)
-                safe_payload = {
-                    "status": response.status_code,
-                    "redirect_uri_used": redirect_override or self.redirect_uri,
-                    "has_client_id": bool(self.client_id),
-                    "error_body": None
-                }
-                try:
-                    safe_payload["error_body"] = response.json()
-                except Exception:
-                    safe_payload["error_body"] = response.text[:500]
-                logger.error(f"Google OAuth token exchange failed: {safe_payload}")
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Error obteniendo token de Google"
-                )
-            
-            return response.json()
+        response = await _HTTPX.post(
+            GOOGLE_TOKEN_URL,
+            data={
+                "code": code,
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "redirect_uri": redirect_override or self.redirect_uri,
+                "grant_type": "authorization_code"
+            }
+        )
+        
+        if response.status_code != 200:
+            # Log detallado para depuración (NO incluye secrets)
+            safe_payload = {
+                "status": response.status_code,
+                "redirect_uri_used": redirect_override or self.redirect_uri,
+                "has_client_id": bool(self.client_id),
+                "error_body": None
+            }
+            try:
+                safe_payload["error_body"] = response.json()
+            except Exception:
+                safe_payload["error_body"] = response.text[:500]
+            logger.error(f"Google OAuth token exchange failed: {safe_payload}")
+            error_body = safe_payload["error_body"]
+            raise GoogleTokenError(error_body.get("error") if isinstance(error_body, dict) else None)
+        
+        return _json_loads(response.content)
     
     async def get_user_info(self, access_token: str) -> GoogleUser:
         """Obtener información del usuario de Google"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                GOOGLE_USERINFO_URL,
-                headers={"Authorization": f"Bearer {access_token}"}
+        response = await _HTTPX.get(
+            GOOGLE_USERINFO_URL,
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+        
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Error obteniendo información del usuario"
             )
-            
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_401_UNAUTHORIZED,
-                    detail="Error obteniendo información del usuario"
-                )
-            
-            user_data = response.json()
-            return GoogleUser(**user_data)
+        
+        user_data = _json_loads(response.content)
+        return GoogleUser(**user_data)
+    
+    async def verify_id_token(self, id_token: str) -> Dict[str, Any]:
+        """Verificar un id_token de Google (RS256) con el JWKS cacheado"""
+        kid = jwt.get_unverified_header(id_token).get("kid")
+        jwks = await _google_jwks()
+        if kid not in jwks:
+            # Rotación de claves: refrescar una vez antes de rechazar
+            jwks = await _google_jwks(force=True)
+        claims = jwt.decode(id_token, _jwk_public_key(jwks[kid]), algorithms=["RS256"], audience=self.client_id)
+        if claims.get("iss") not in GOOGLE_ISSUERS:
+            raise jwt.InvalidIssuerError("Issuer inválido")
+        return claims
+    
+    async def user_from_id_token(self, id_token: Optional[str]) -> Optional[GoogleUser]:
+        """Construir el usuario desde los claims del id_token (scope openid email profile).
+        Devuelve None si falta, no se puede verificar o no trae los claims mínimos."""
+        if not id_token:
+            return None
+        try:
+            claims = await self.verify_id_token(id_token)
+        except Exception as e:
+            logger.warning(f"id_token no verificable, usando /userinfo: {e}")
+            return None
+        if "sub" not in claims or "email" not in claims:
+            return None
+        return GoogleUser(
+            id=claims["sub"],
+            email=claims["email"],
+            name=claims.get("name", ""),
+            picture=claims.get("picture", ""),
+            verified_email=claims.get("email_verified", False),
+            locale=claims.get("locale"),
+        )
     
     def create_jwt_token(self, user: GoogleUser, subscription_tier: str = "free", role: str = "student") -> str:
         """Crear JWT token para el usuario con rol"""
+        now = int(time.time())
         payload = {
             "sub": user.id,
             "email": user.email,
@@ -149,39 +324,54 @@ class GoogleAuthService:
             "picture": user.picture,
             "subscription_tier": subscription_tier,
             "role": role,
-            "exp": datetime.utcnow() + timedelta(hours=JWT_EXPIRATION_HOURS),
-            "iat": datetime.utcnow()
+            "exp": now + JWT_EXPIRATION_SECONDS,
+            "iat": now
         }
         
-        return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+        return _jwt_encode(payload)
     
     def verify_jwt_token(self, token: str) -> Dict[str, Any]:
-        """Verificar y decodificar JWT token"""
+        """Verificar y decodificar JWT token (cacheado por hash del token, ver _JWT_CACHE)"""
+        key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        now = time.time()
+        entry = _JWT_CACHE.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1].copy()
         try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            return payload
+            payload = _jwt_decode(token)
+            # Normalizar campos opcionales: los consumidores pueden indexar sin .get(..., default)
+            payload.setdefault("picture", "")
+            payload.setdefault("subscription_tier", "free")
+            payload.setdefault("role", "student")
         except jwt.ExpiredSignatureError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token expirado"
+                detail="Token expirado",
+                headers={"WWW-Authenticate": "Bearer"}
             )
         except jwt.InvalidTokenError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token inválido"
+                detail="Token inválido",
+                headers={"WWW-Authenticate": "Bearer"}
             )
+        _cache_jwt_payload(key, payload, now)
+        return payload.copy()
     
     async def authenticate_with_google(self, code: str, redirect_override: Optional[str] = None) -> AuthToken:
         """Proceso completo de autenticación con Google"""
         token_data = await self.exchange_code_for_token(code, redirect_override=redirect_override)
         
-        # 2. Obtener información del usuario
-        google_user = await self.get_user_info(token_data["access_token"])
+        # 2. Obtener información del usuario (id_token si viene; /userinfo como respaldo)
+        google_user = await self.user_from_id_token(token_data.get("id_token"))
+        if google_user is None:
+            google_user = await self.get_user_info(token_data["access_token"])
         # 3. Determinar rol (simple: lista blanca de correos de profesores)
         role = "teacher" if google_user.email.lower() in TEACHER_EMAILS else "student"
         
-        # 4. Obtener tier de suscripción (conectar con Stripe)
-        subscription_tier = await self.get_user_subscription_tier(google_user.id)
+        # 4. Tier de suscripción: get_user_subscription_tier aún no consulta Stripe y siempre es "free".
+        # Cuando lo haga, lanzarlo en paralelo con la obtención del usuario (asyncio.gather).
+        subscription_tier = "free"
         
         # 5. Persistir / actualizar usuario en BD
         db_user = get_or_create_from_google({
@@ -212,21 +402,39 @@ class GoogleAuthService:
         # Por ahora retornamos "free", esto se conectará con Stripe
         return "free"
 
+    async def aclose(self) -> None:
+        """Cerrar el cliente HTTP compartido (llamar en el shutdown de la app)"""
+        await _HTTPX.aclose()
+
 # Dependencia para verificar autenticación
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
-    """Obtener usuario actual desde el token"""
-    auth_service = GoogleAuthService()
-    token = credentials.credentials
-    
-    try:
-        payload = auth_service.verify_jwt_token(token)
-        return payload
-    except Exception as e:
+async def get_current_user(request: Request) -> Dict[str, Any]:
+    """Obtener usuario actual desde el token (Authorization: Bearer o, con AUTH_HTTPONLY_COOKIE, cookie access_token)"""
+    # Parseo directo de la cabecera (equivale a HTTPBearer(auto_error=False) sin crear credenciales)
+    h = request.headers.get("authorization")
+    if h and h[:7].lower() == "bearer ":
+        token = h[7:].strip()
+    elif AUTH_HTTPONLY_COOKIE:
+        token = request.cookies.get("access_token")
+    else:
+        token = None
+    if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="No se pudo validar las credenciales",
+            detail="Token de acceso requerido",
             headers={"WWW-Authenticate": "Bearer"}
         )
+    
+    # verify_jwt_token ya lanza 401 con detalle (expirado / inválido) y WWW-Authenticate
+    return google_auth.verify_jwt_token(token)
+
+# Orden de los tiers de suscripción (mismos valores que SubscriptionTier de payments)
+class TierLevel(IntEnum):
+    FREE = 0
+    BASIC = 1
+    PRO = 2
+    ENTERPRISE = 3
+
+_TIER_FROM_STR = {t.name.lower(): t for t in TierLevel}
 
 # Dependencia para verificar suscripción
 async def require_subscription(
@@ -236,14 +444,7 @@ async def require_subscription(
     """Verificar que el usuario tiene el tier de suscripción requerido"""
     user_tier = current_user.get("subscription_tier", "free")
     
-    tier_levels = {
-        "free": 0,
-        "basic": 1,
-        "pro": 2,
-        "enterprise": 3
-    }
-    
-    if tier_levels.get(user_tier, 0) < tier_levels.get(tier, 0):
+    if _TIER_FROM_STR.get(user_tier, TierLevel.FREE) < _TIER_FROM_STR.get(tier, TierLevel.FREE):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail=f"Se requiere suscripción {tier} o superior"
@@ -260,10 +461,16 @@ async def require_teacher(current_user: Dict[str, Any] = Depends(get_current_use
 
 def role_required(*roles: str):
     """Generar dependencia para uno o varios roles"""
+    return _role_checker(frozenset(roles))
+
+@lru_cache(maxsize=None)
+def _role_checker(allowed: frozenset):
+    # Mismo conjunto de roles -> misma función: FastAPI la resuelve una sola vez por request
     async def _checker(current_user: Dict[str, Any] = Depends(get_current_user)):
-        if current_user.get("role") not in roles:
+        if current_user.get("role") not in allowed:
             raise HTTPException(status_code=403, detail="Rol no autorizado")
         return current_user
+    _checker.__name__ = "require_roles_" + "_".join(sorted(allowed))
     return _checker
 
 # Instancia global
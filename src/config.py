@@ -2,27 +2,46 @@
 Configuración del sistema educativo multiagente con Groq y Agno
 """
 
-import os
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
-from typing import Optional, Dict, Any, List
-from pydantic import Field, field_validator
-from pydantic_settings import BaseSettings
+from types import MappingProxyType
+from typing import ClassVar, Optional, Dict, Any, FrozenSet, Set, Tuple
+from pydantic import Field, PrivateAttr, computed_field, field_validator
+from pydantic_settings import SettingsConfigDict
 
+# Base compartida con config_production (módulo aparte: importarla no crea Settings ni directorios)
+try:
+    from src.config_base import BaseAppSettings
+except ImportError:  # fallback if executed with package root already at src
+    from config_base import BaseAppSettings
 
-class Settings(BaseSettings):
+
+_SIZE_UNITS = {"B": 1, "KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+
+
+def _parse_size(value: Any) -> int:
+    """Convertir tamaños como "50MB" o "1024" a bytes"""
+    if isinstance(value, int):
+        return value
+    text = str(value).strip().upper()
+    for unit in ("KB", "MB", "GB", "B"):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * _SIZE_UNITS[unit])
+    return int(text)
+
+
+class Settings(BaseAppSettings):
     """Configuración principal del sistema"""
     
+    model_config = SettingsConfigDict(env_file=[".env", "../.env"])  # Buscar en directorio actual y padre
+    
     # API Keys
-    groq_api_key: str = Field(default="", env="GROQ_API_KEY")
     openai_api_key: Optional[str] = Field(default=None, env="OPENAI_API_KEY")
     
-    # Configuración de Groq - Usando modelo GPT OSS 20B
-    groq_model: str = "openai/gpt-oss-20b"  # Modelo principal actualizado
-    model: str = "openai/gpt-oss-20b"  # Alias para compatibilidad
+    # Modelos Groq alternativos
     groq_fast_model: str = "llama-3.1-8b-instant"  # Modelo rápido alternativo
     groq_creative_model: str = "mixtral-8x7b-32768"  # Para tareas creativas
-    groq_temperature: float = 0.3  # Más determinístico
-    groq_max_tokens: int = 8192
     
     # Directorios
     base_dir: Path = Path(__file__).parent.parent
@@ -42,21 +61,16 @@ class Settings(BaseSettings):
     # Servidor
     host: str = "127.0.0.1"
     port: int = 8000
-    debug: bool = True
     
     # Aplicación
-    max_file_size: str = "50MB"
-    allowed_extensions: List[str] = Field(default=["pdf", "docx", "xlsx", "txt", "md", "pptx"])
+    max_file_size: int = 50 * 1024 * 1024  # 50MB; acepta "50MB" desde el entorno
+    allowed_extensions: FrozenSet[str] = frozenset({"pdf", "docx", "xlsx", "txt", "md", "pptx"})
     max_tokens: int = 4096
     
     # Agentes
     agent_timeout: int = 300
     max_concurrent_agents: int = 5
     
-    # Logging
-    log_level: str = "INFO"
-    log_file: str = "logs/app.log"
-    
     # === FUNCIONALIDADES ESTILO RISELY.AI MEJORADAS ===
     
     # Personalización de estudiantes (como Risely.ai pero mejor)
@@ -89,15 +103,29 @@ class Settings(BaseSettings):
     learning_paths: bool = True
     social_learning: bool = True
     
-    class Config:
-        env_file = [".env", "../.env"]  # Buscar en directorio actual y padre
-        case_sensitive = False
-        extra = "ignore"  # Ignorar campos extra del .env
+    # Directorios ya creados en este proceso (compartido entre instancias)
+    _dirs_created: ClassVar[Set[Path]] = set()
+    # groq_api_key no vacía, calculado una vez al construir
+    _api_key_ok: bool = PrivateAttr(default=False)
+    
+    def model_post_init(self, __context: Any) -> None:
+        self._api_key_ok = bool(self.groq_api_key and self.groq_api_key.strip())
     
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # Crear directorios si no existen
-        self.create_directories()
+    @computed_field
+    @property
+    def model(self) -> str:
+        """Alias de groq_model para compatibilidad"""
+        return self.groq_model
+    
+    @field_validator("allowed_extensions", mode="after")
+    @classmethod
+    def _normalize_extensions(cls, v: FrozenSet[str]) -> FrozenSet[str]:
+        return frozenset(ext.lower() for ext in v)
+    
+    @field_validator("max_file_size", mode="before")
+    @classmethod
+    def _parse_max_file_size(cls, v: Any) -> int:
+        return _parse_size(v)
     
     def create_directories(self):
         """Crear directorios necesarios"""
@@ -110,184 +138,141 @@ class Settings(BaseSettings):
         ]
         
         for directory in directories:
-            directory.mkdir(parents=True, exist_ok=True)
+            if directory in Settings._dirs_created:
+                continue
+            if not directory.is_dir():
+                directory.mkdir(parents=True, exist_ok=True)
+            Settings._dirs_created.add(directory)
     
     def verify_api_key(self) -> bool:
         """Verificar que la API key esté configurada"""
-        return bool(self.groq_api_key and self.groq_api_key.strip())
+        return self._api_key_ok
     
     def get_debug_info(self) -> dict:
         """Obtener información de debug de la configuración"""
         return {
-            "groq_api_key_present": bool(self.groq_api_key and self.groq_api_key.strip()),
+            "groq_api_key_present": self._api_key_ok,
             "groq_api_key_length": len(self.groq_api_key) if self.groq_api_key else 0,
             "groq_model": self.groq_model,
             "base_dir": str(self.base_dir),
-            "env_file_exists": os.path.exists(self.base_dir / ".env"),
-            "parent_env_file_exists": os.path.exists(self.base_dir.parent / ".env")
+            "env_file_exists": (self.base_dir / ".env").exists(),
+            "parent_env_file_exists": (self.base_dir.parent / ".env").exists()
         }
 
 
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Instancia única de configuración (con sus directorios creados)"""
+    s = Settings()
+    s.create_directories()
+    return s
+
+
 # Instancia global de configuración
-settings = Settings()
+settings = get_settings()
+
+
+@dataclass(frozen=True, slots=True)
+class ModelSpec:
+    """Descripción de un modelo Groq disponible"""
+    name: str
+    description: str
+    max_tokens: int
+    use_cases: Tuple[str, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class AgentSpec:
+    """Configuración de modelo e instrucciones de un tipo de agente"""
+    model: str
+    temperature: float
+    max_tokens: int
+    memory_enabled: bool = True
+    tools: Tuple[Any, ...] = ()
+    instructions: Tuple[str, ...] = ()
+    enable_file_tools: bool = False
+    enable_reasoning_tools: bool = True
 
 
 # Configuración específica de modelos Groq
-GROQ_MODELS = {
-    "openai/gpt-oss-20b": {
-        "name": "GPT OSS 20B",
-        "description": "Modelo GPT open source de 20B parámetros - Principal",
-        "max_tokens": 8192,
-        "use_cases": ["curriculum", "exams", "complex_analysis", "tutoring"]
-    },
-    "llama-3.3-70b-versatile": {
-        "name": "Llama 3.3 70B",
-        "description": "Modelo principal para tareas complejas",
-        "max_tokens": 32768,
-        "use_cases": ["curriculum", "exams", "complex_analysis"]
-    },
-    "llama-3.1-8b-instant": {
-        "name": "Llama 3.1 8B Instant", 
-        "description": "Modelo rápido para tareas simples",
-        "max_tokens": 8192,
-        "use_cases": ["quick_questions", "summaries", "simple_tasks"]
-    },
-    "llama-3.2-90b-text-preview": {
-        "name": "Llama 3.2 90B Preview",
-        "description": "Modelo experimental para tareas avanzadas",
-        "max_tokens": 8192,
-        "use_cases": ["research", "advanced_analysis"]
-    },
-    "mixtral-8x7b-32768": {
-        "name": "Mixtral 8x7B",
-        "description": "Modelo multilingüe especializado",
-        "max_tokens": 32768,
-        "use_cases": ["multilingual", "code_generation"]
-    }
-}
+GROQ_MODELS = MappingProxyType({
+    "openai/gpt-oss-20b": ModelSpec(
+        name="GPT OSS 20B",
+        description="Modelo GPT open source de 20B parámetros - Principal",
+        max_tokens=8192,
+        use_cases=("curriculum", "exams", "complex_analysis", "tutoring"),
+    ),
+    "llama-3.3-70b-versatile": ModelSpec(
+        name="Llama 3.3 70B",
+        description="Modelo principal para tareas complejas",
+        max_tokens=32768,
+        use_cases=("curriculum", "exams", "complex_analysis"),
+    ),
+    "llama-3.1-8b-instant": ModelSpec(
+        name="Llama 3.1 8B Instant",
+        description="Modelo rápido para tareas simples",
+        max_tokens=8192,
+        use_cases=("quick_questions", "summaries", "simple_tasks"),
+    ),
+    "llama-3.2-90b-text-preview": ModelSpec(
+        name="Llama 3.2 90B Preview",
+        description="Modelo experimental para tareas avanzadas",
+        max_tokens=8192,
+        use_cases=("research", "advanced_analysis"),
+    ),
+    "mixtral-8x7b-32768": ModelSpec(
+        name="Mixtral 8x7B",
+        description="Modelo multilingüe especializado",
+        max_tokens=32768,
+        use_cases=("multilingual", "code_generation"),
+    ),
+})
 
 
-# Configuración de agentes
-AGENT_CONFIGS = {
-    "exam_generator": {
-        "model": "openai/gpt-oss-20b",  # Usar GPT OSS 20B
-        "temperature": 0.7,
-        "max_tokens": 4096,
-        "memory_enabled": True,
-        "tools": [],  # Sin herramientas complejas
-        "instructions": [
-            "Use markdown to format your answers.",
-            "IMPORTANTE: Para matemáticas, usa SIEMPRE sintaxis LaTeX:",
-            "- Matemáticas en línea: $expresión$ (ejemplo: $f(x) = x^2$)",
-            "- Matemáticas en bloque: $$expresión$$ (ejemplo: $$\\frac{df}{dx} = 2x$$)",
-            "- NUNCA uses paréntesis (expresión) para matemáticas",
-            "- Ejemplos correctos: $y = f(x)$, $f'(x)$, $\\dfrac{df}{dx}$, $$f'(x) = \\lim_{h \\to 0} \\frac{f(x+h) - f(x)}{h}$$"
-        ]
-    },
-    "curriculum_creator": {
-        "model": "openai/gpt-oss-20b",  # Usar GPT OSS 20B
-        "temperature": 0.7,
-        "max_tokens": 4096,
-        "memory_enabled": True,
-        "tools": [],
-        "instructions": [
-            "Use markdown to format your answers.",
-            "IMPORTANTE: Para matemáticas, usa SIEMPRE sintaxis LaTeX:",
-            "- Matemáticas en línea: $expresión$ (ejemplo: $f(x) = x^2$)",
-            "- Matemáticas en bloque: $$expresión$$ (ejemplo: $$\\frac{df}{dx} = 2x$$)",
-            "- NUNCA uses paréntesis (expresión) para matemáticas",
-            "- Ejemplos correctos: $y = f(x)$, $f'(x)$, $\\dfrac{df}{dx}$, $$f'(x) = \\lim_{h \\to 0} \\frac{f(x+h) - f(x)}{h}$$"
-        ]
-    },
-    "tutor": {
-        "model": "openai/gpt-oss-20b",  # Usar GPT OSS 20B
-        "temperature": 0.8,
-        "max_tokens": 2048,
-        "memory_enabled": True,
-        "tools": [],
-        "instructions": [
-            "Use markdown to format your answers.",
-            "IMPORTANTE: Para matemáticas, usa SIEMPRE sintaxis LaTeX:",
-            "- Matemáticas en línea: $expresión$ (ejemplo: $f(x) = x^2$)",
-            "- Matemáticas en bloque: $$expresión$$ (ejemplo: $$\\frac{df}{dx} = 2x$$)",
-            "- NUNCA uses paréntesis (expresión) para matemáticas",
-            "- Ejemplos correctos: $y = f(x)$, $f'(x)$, $\\dfrac{df}{dx}$, $$f'(x) = \\lim_{h \\to 0} \\frac{f(x+h) - f(x)}{h}$$"
-        ]
-    },
-    "lesson_planner": {
-        "model": "openai/gpt-oss-20b",  # Usar GPT OSS 20B
-        "temperature": 0.7,
-        "max_tokens": 4096,
-        "memory_enabled": True,
-        "tools": [],
-        "instructions": [
-            "Use markdown to format your answers.",
-            "IMPORTANTE: Para matemáticas, usa SIEMPRE sintaxis LaTeX:",
-            "- Matemáticas en línea: $expresión$ (ejemplo: $f(x) = x^2$)",
-            "- Matemáticas en bloque: $$expresión$$ (ejemplo: $$\\frac{df}{dx} = 2x$$)",
-            "- NUNCA uses paréntesis (expresión) para matemáticas",
-            "- Ejemplos correctos: $y = f(x)$, $f'(x)$, $\\dfrac{df}{dx}$, $$f'(x) = \\lim_{h \\to 0} \\frac{f(x+h) - f(x)}{h}$$"
-        ]
-    },
-    "document_analyzer": {
-        "model": "openai/gpt-oss-20b",  # Usar GPT OSS 20B
-        "temperature": 0.5,
-        "max_tokens": 4096,
-        "memory_enabled": True,
-        "tools": [],
-        "instructions": [
-            "Use markdown to format your answers.",
-            "IMPORTANTE: Para matemáticas, usa SIEMPRE sintaxis LaTeX:",
-            "- Matemáticas en línea: $expresión$ (ejemplo: $f(x) = x^2$)",
-            "- Matemáticas en bloque: $$expresión$$ (ejemplo: $$\\frac{df}{dx} = 2x$$)",
-            "- NUNCA uses paréntesis (expresión) para matemáticas",
-            "- Ejemplos correctos: $y = f(x)$, $f'(x)$, $\\dfrac{df}{dx}$, $$f'(x) = \\lim_{h \\to 0} \\frac{f(x+h) - f(x)}{h}$$"
-        ]
-    },
-    "student_coach": {
-        "model": "openai/gpt-oss-20b",  # Usar GPT OSS 20B
-        "temperature": 0.7,
-        "max_tokens": 2048,
-        "memory_enabled": True,
-        "tools": [],
-        "instructions": [
-            "Use markdown to format your answers.",
-            "IMPORTANTE: Para matemáticas, usa SIEMPRE sintaxis LaTeX:",
-            "- Matemáticas en línea: $expresión$ (ejemplo: $f(x) = x^2$)",
-            "- Matemáticas en bloque: $$expresión$$ (ejemplo: $$\\frac{df}{dx} = 2x$$)",
-            "- NUNCA uses paréntesis (expresión) para matemáticas",
-            "- Ejemplos correctos: $y = f(x)$, $f'(x)$, $\\dfrac{df}{dx}$, $$f'(x) = \\lim_{h \\to 0} \\frac{f(x+h) - f(x)}{h}$$"
-        ]
-    },
-    "analytics": {
-        "model": "openai/gpt-oss-20b",  # Usar GPT OSS 20B
-        "temperature": 0.5,
-        "max_tokens": 4096,
-        "memory_enabled": True,
-        "tools": [],
-        "instructions": [
-            "Use markdown to format your answers.",
-            "IMPORTANTE: Para matemáticas, usa SIEMPRE sintaxis LaTeX:",
-            "- Matemáticas en línea: $expresión$ (ejemplo: $f(x) = x^2$)",
-            "- Matemáticas en bloque: $$expresión$$ (ejemplo: $$\\frac{df}{dx} = 2x$$)",
-            "- NUNCA uses paréntesis (expresión) para matemáticas",
-            "- Ejemplos correctos: $y = f(x)$, $f'(x)$, $\\dfrac{df}{dx}$, $$f'(x) = \\lim_{h \\to 0} \\frac{f(x+h) - f(x)}{h}$$"
-        ]
-    }
+# Instrucciones comunes a todos los agentes (tupla compartida, no se copia por agente)
+_MATH_LATEX_INSTRUCTIONS = (
+    "Use markdown to format your answers.",
+    "IMPORTANTE: Para matemáticas, usa SIEMPRE sintaxis LaTeX:",
+    "- Matemáticas en línea: $expresión$ (ejemplo: $f(x) = x^2$)",
+    "- Matemáticas en bloque: $$expresión$$ (ejemplo: $$\\frac{df}{dx} = 2x$$)",
+    "- NUNCA uses paréntesis (expresión) para matemáticas",
+    "- Ejemplos correctos: $y = f(x)$, $f'(x)$, $\\dfrac{df}{dx}$, $$f'(x) = \\lim_{h \\to 0} \\frac{f(x+h) - f(x)}{h}$$",
+)
+
+
+# Configuración de agentes (todos usan GPT OSS 20B, sin herramientas complejas)
+AGENT_CONFIGS = MappingProxyType({
+    "exam_generator": AgentSpec("openai/gpt-oss-20b", 0.7, 4096, instructions=_MATH_LATEX_INSTRUCTIONS),
+    "curriculum_creator": AgentSpec("openai/gpt-oss-20b", 0.7, 4096, instructions=_MATH_LATEX_INSTRUCTIONS),
+    "tutor": AgentSpec("openai/gpt-oss-20b", 0.8, 2048, instructions=_MATH_LATEX_INSTRUCTIONS),
+    "lesson_planner": AgentSpec("openai/gpt-oss-20b", 0.7, 4096, instructions=_MATH_LATEX_INSTRUCTIONS),
+    "document_analyzer": AgentSpec("openai/gpt-oss-20b", 0.5, 4096, instructions=_MATH_LATEX_INSTRUCTIONS),
+    "student_coach": AgentSpec("openai/gpt-oss-20b", 0.7, 2048, instructions=_MATH_LATEX_INSTRUCTIONS),
+    "analytics": AgentSpec("openai/gpt-oss-20b", 0.5, 4096, instructions=_MATH_LATEX_INSTRUCTIONS),
+})
+
+# Agentes sin entrada propia: modelo por defecto de settings y sin instrucciones base
+DEFAULT_AGENT_SPEC = AgentSpec(settings.groq_model, settings.groq_temperature, settings.groq_max_tokens)
+
+
+# (model, temperature, max_tokens) por agente, con los valores por defecto ya aplicados
+_RESOLVED = {
+    agent_type: (spec.model, spec.temperature, spec.max_tokens)
+    for agent_type, spec in AGENT_CONFIGS.items()
 }
+_DEFAULT_MODEL_CONFIG = (DEFAULT_AGENT_SPEC.model, DEFAULT_AGENT_SPEC.temperature, DEFAULT_AGENT_SPEC.max_tokens)
 
 
 def get_model_config(agent_type: str) -> Dict[str, Any]:
     """
     Obtiene la configuración de modelo para un tipo de agente
     """
-    agent_config = AGENT_CONFIGS.get(agent_type, {})
-    model_name = agent_config.get("model", settings.groq_model)
+    model_name, temperature, max_tokens = _RESOLVED.get(agent_type, _DEFAULT_MODEL_CONFIG)
     
     return {
         "model": model_name,
-        "temperature": agent_config.get("temperature", settings.groq_temperature),
-        "max_tokens": agent_config.get("max_tokens", settings.groq_max_tokens),
+        "temperature": temperature,
+        "max_tokens": max_tokens,
         "api_key": settings.groq_api_key
     }
 
@@ -296,7 +281,7 @@ def validate_api_keys() -> bool:
     """
     Valida que las API keys necesarias estén configuradas
     """
-    if not settings.groq_api_key:
+    if not settings.verify_api_key():
         print("⚠️ GROQ_API_KEY no está configurada")
         print("Obtén tu API key en: https://console.groq.com/keys")
         return False
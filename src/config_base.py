@@ -0,0 +1,27 @@
+"""
+Campos de configuración comunes a desarrollo (config.py) y producción (config_production.py)
+"""
+
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class BaseAppSettings(BaseSettings):
+    """Campos comunes a la configuración de desarrollo y de producción"""
+    
+    model_config = SettingsConfigDict(
+        case_sensitive=False,
+        extra="ignore",  # Ignorar campos extra del .env
+        env_file_encoding="utf-8",
+        frozen=True,  # Solo lectura tras cargar; se comparte entre módulos
+    )
+    
+    # Configuración de Groq - Usando modelo GPT OSS 20B
+    groq_api_key: str = ""
+    groq_model: str = "openai/gpt-oss-20b"  # Modelo principal actualizado
+    groq_temperature: float = 0.3  # Más determinístico
+    groq_max_tokens: int = 8192
+    
+    # Entorno y logging
+    debug: bool = True
+    log_level: str = "INFO"
+    log_file: str = "logs/app.log"
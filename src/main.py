@@ -182,7 +182,7 @@ async def upload_document(
         if file_extension not in settings.allowed_extensions:
             raise HTTPException(
                 status_code=400,
-                detail=f"Tipo de archivo no permitido. Extensiones válidas: {settings.allowed_extensions}"
+                detail=f"Tipo de archivo no permitido. Extensiones válidas: {', '.join(sorted(settings.allowed_extensions))}"
             )
         
         # Leer contenido del archivo
@@ -48,16 +48,15 @@ def extract_user_from_request(request) -> Optional[Dict[str, Any]]:
         
         # Importar el servicio de autenticación
         try:
-            from src.auth.google_auth import GoogleAuthService
+            from src.auth.google_auth import google_auth
         except ImportError:
             try:
-                from auth.google_auth import GoogleAuthService
+                from auth.google_auth import google_auth
             except ImportError:
-                print("🔍 Debug auth: Could not import GoogleAuthService")
+                print("🔍 Debug auth: Could not import google_auth")
                 return None
         
-        auth_service = GoogleAuthService()
-        payload = auth_service.verify_jwt_token(token)
+        payload = google_auth.verify_jwt_token(token)
         print(f"🔍 Debug auth: Token verified, payload: {payload}")
         return payload
         
@@ -124,6 +123,7 @@ if SRC_DIR not in sys.path:
 Si falla, mostramos diagnóstico detallado para evitar 404 silencioso en /api/auth/google/login."""
 _AUTH_ROUTERS_AVAILABLE = False
 _auth_import_errors = {}
+_auth_module = None
 import importlib, types
 
 def _attempt_import(name: str):
@@ -145,6 +145,7 @@ for cand in [c for c in mod_candidates if c and c not in seen]:
     mod = _attempt_import(cand)
     if isinstance(mod, types.ModuleType) and hasattr(mod, 'auth_router') and hasattr(mod, 'subscription_router'):
         auth_router = getattr(mod, 'auth_router')  # type: ignore
+        _auth_module = mod
         subscription_router = getattr(mod, 'subscription_router')  # type: ignore
         # Intentar importar también oauth_redirect_router si existe
         oauth_redirect_router = getattr(mod, 'oauth_redirect_router', None) if hasattr(mod, 'oauth_redirect_router') else None
@@ -293,6 +294,12 @@ async def ensure_next_after_startup():
     if not _is_route_mounted('/_next'):
         asyncio.create_task(_delayed_next_mount())
 
+@app.on_event("shutdown")
+async def close_auth_http_client():
+    # Cerrar el pool httpx compartido de Google OAuth
+    if _auth_module is not None:
+        await _auth_module.google_auth.aclose()
+
 @app.get("/debug/remount-static")
 def debug_remount_static():
     """Fuerza un reintento de montaje de static/_next (dev)."""
@@ -1868,11 +1875,12 @@ async def health_db():
     """Verificar conexión a la base de datos y existencia de tabla users.
     Devuelve status, driver, url segura y latencia.
     """
+    # Mismo orden que google_auth (src.auth primero): una sola copia de users_db, su engine y sus cachés
     try:
-        from auth import users_db  # type: ignore
+        from src.auth import users_db  # type: ignore
     except ImportError:
         try:
-            from src.auth import users_db  # fallback
+            from auth import users_db  # fallback
         except ImportError as e:  # pragma: no cover
             return {"status": "down", "error": f"users_db import failed: {e}"}
     engine = users_db.engine
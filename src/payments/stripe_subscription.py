@@ -3,6 +3,7 @@ Sistema de suscripciones con Stripe
 """
 
 import os
+import asyncio
 import logging
 from typing import Dict, Any, List, Optional
 from datetime import datetime
@@ -144,6 +145,11 @@ class StripeSubscriptionService:
     def __init__(self):
         self.stripe_available = STRIPE_AVAILABLE
         self.plans = SUBSCRIPTION_PLANS
+        # price_id de Stripe por tier y período de facturación
+        self.price_ids = {
+            tier: {"monthly": plan.stripe_price_id_monthly, "yearly": plan.stripe_price_id_yearly}
+            for tier, plan in self.plans.items()
+        }
         
         if not self.stripe_available:
             logger.warning("⚠️ Stripe no disponible - usando modo simulado")
@@ -292,16 +298,16 @@ class StripeSubscriptionService:
             logger.error(f"Error actualizando suscripción: {e}")
             raise
     
-    async def handle_webhook(self, payload: bytes, signature: str) -> Dict[str, Any]:
-        """Manejar webhooks de Stripe"""
+    def construct_webhook_event(self, payload: bytes, signature: str):
+        """Verificar la firma del webhook y construir el evento (None en modo simulado).
+        Es síncrono (HMAC-SHA256 sobre el payload): desde async llamar con asyncio.to_thread."""
         if not self.stripe_available:
-            return {"status": "simulated"}
-        
+            return None
+        return stripe.Webhook.construct_event(payload, signature, STRIPE_WEBHOOK_SECRET)
+
+    async def process_webhook_event(self, event) -> Dict[str, Any]:
+        """Procesar un evento de Stripe ya verificado"""
         try:
-            event = stripe.Webhook.construct_event(
-                payload, signature, STRIPE_WEBHOOK_SECRET
-            )
-            
             # Manejar diferentes tipos de eventos
             if event.type == 'checkout.session.completed':
                 session = event.data.object
@@ -323,6 +329,20 @@ class StripeSubscriptionService:
         except Exception as e:
             logger.error(f"Error procesando webhook: {e}")
             raise
+
+    async def handle_webhook(self, payload: bytes, signature: str) -> Dict[str, Any]:
+        """Manejar webhooks de Stripe (verificación + procesamiento en la misma llamada)"""
+        if not self.stripe_available:
+            return {"status": "simulated"}
+        
+        try:
+            # construct_event calcula HMAC-SHA256 sobre todo el payload: se ejecuta
+            # en un hilo para no bloquear el event loop con webhooks grandes
+            event = await asyncio.to_thread(self.construct_webhook_event, payload, signature)
+        except Exception as e:
+            logger.error(f"Error procesando webhook: {e}")
+            raise
+        return await self.process_webhook_event(event)
     
     def check_usage_limits(self, user_tier: SubscriptionTier, usage_type: str, current_usage: int) -> bool:
         """Verificar si el usuario ha alcanzado los límites de su plan"""
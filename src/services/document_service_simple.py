@@ -23,6 +23,8 @@ class DocumentService:
         settings.upload_dir.mkdir(parents=True, exist_ok=True)
         # Almacenamiento simple en memoria (en producción usar base de datos)
         self.documents = []
+        # Contenido en minúsculas por id, calculado una vez al subir (la búsqueda no re-normaliza)
+        self._content_lower: Dict[str, str] = {}
     
     async def upload_document(self, file_content: bytes, filename: str, 
                             subject: str = None, grade_level: str = None) -> Document:
@@ -61,6 +63,7 @@ class DocumentService:
         
         # Almacenar en memoria (temporal)
         self.documents.append(document)
+        self._content_lower[doc_id] = content.lower()
         
         return document
     
@@ -131,7 +134,11 @@ class DocumentService:
                 continue
             
             # Búsqueda simple por contenido
-            if query_lower in doc.content.lower():
+            content_lower = self._content_lower.get(doc.id)
+            if content_lower is None:
+                content_lower = self._content_lower[doc.id] = doc.content.lower()
+            score = content_lower.count(query_lower)
+            if score:
                 results.append({
                     "id": doc.id,
                     "filename": doc.filename,
@@ -139,7 +146,7 @@ class DocumentService:
                     "subject": doc.subject,
                     "grade_level": doc.grade_level,
                     "metadata": doc.metadata,
-                    "relevance_score": doc.content.lower().count(query_lower)  # Score simple
+                    "relevance_score": score  # Score simple
                 })
         
         # Ordenar por relevancia (frecuencia de aparición)
@@ -167,6 +174,7 @@ class DocumentService:
             if doc.id == document_id:
                 doc_to_delete = doc
                 del self.documents[i]
+                self._content_lower.pop(document_id, None)
                 break
         
         if doc_to_delete:
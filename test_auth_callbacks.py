@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Pruebas de los callbacks OAuth: intercambio de code de un solo uso y cookie access_token
+"""
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+for _mod in ("fastapi", "jwt", "httpx", "sqlalchemy", "stripe"):
+    pytest.importorskip(_mod)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from src import api_auth_endpoints  # noqa: E402
+
+
+class _CountingAuth:
+    """Sustituye a authenticate_with_google: cuenta llamadas y tarda un poco"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self, code, redirect_override=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return f"token-{self.calls}"
+
+
+def test_code_exchange_shared_only_while_in_flight(monkeypatch):
+    fake = _CountingAuth()
+    monkeypatch.setattr(api_auth_endpoints.google_auth, "authenticate_with_google", fake)
+
+    async def scenario():
+        a, b = await asyncio.gather(
+            api_auth_endpoints._authenticate_once("code-1"),
+            api_auth_endpoints._authenticate_once("code-1"),
+        )
+        assert a == b == "token-1"  # doble clic concurrente: un solo intercambio
+        assert fake.calls == 1
+        assert api_auth_endpoints._code_exchanges == {}
+        # Replay posterior: vuelve a Google (que lo rechazaría) en vez de reutilizar el token
+        assert await api_auth_endpoints._authenticate_once("code-1") == "token-2"
+        assert fake.calls == 2
+
+    asyncio.run(scenario())
+
+
+@pytest.fixture
+def flag_client(monkeypatch):
+    """Cliente con AUTH_HTTPONLY_COOKIE activo y un intercambio de code simulado"""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    async def fake_auth(code, redirect_override=None):
+        return SimpleNamespace(access_token="jwt-" + code, user={"email": "ana@example.com"})
+
+    monkeypatch.setattr(api_auth_endpoints, "AUTH_HTTPONLY_COOKIE", True)
+    monkeypatch.setattr(api_auth_endpoints.google_auth, "authenticate_with_google", fake_auth)
+    app = FastAPI()
+    app.include_router(api_auth_endpoints.auth_router)
+    return TestClient(app, follow_redirects=False)
+
+
+def test_json_callback_sets_httponly_cookie_in_flag_mode(flag_client):
+    resp = flag_client.get("/api/auth/google/callback", params={"code": "c1"})
+    assert resp.status_code == 200
+    assert "HttpOnly" in resp.headers["set-cookie"]
+
+
+def test_redirect_callback_redirects_with_httponly_cookie_in_flag_mode(flag_client):
+    resp = flag_client.get("/api/auth/google/callback/redirect", params={"code": "c2"})
+    assert resp.status_code == 302
+    assert "HttpOnly" in resp.headers["set-cookie"]
+    assert "jwt-c2" not in resp.text  # el token no va en el cuerpo para JS
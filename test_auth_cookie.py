@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Pruebas de get_current_user y /me: la cookie access_token solo autentica con AUTH_HTTPONLY_COOKIE
+"""
+
+import os
+import sys
+
+import pytest
+
+for _mod in ("fastapi", "jwt", "httpx", "sqlalchemy"):
+    pytest.importorskip(_mod)
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from fastapi import Depends, FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from src.auth import google_auth  # noqa: E402
+
+app = FastAPI()
+
+
+@app.get("/protected")
+async def protected(user=Depends(google_auth.get_current_user)):
+    return {"email": user["email"]}
+
+
+client = TestClient(app)
+
+
+def _token() -> str:
+    user = google_auth.GoogleUser(id="1", email="ana@example.com", name="Ana", picture="", verified_email=True)
+    return google_auth.google_auth.create_jwt_token(user)
+
+
+def test_cookie_only_request_is_rejected_without_flag(monkeypatch):
+    monkeypatch.setattr(google_auth, "AUTH_HTTPONLY_COOKIE", False)
+    client.cookies.set("access_token", _token())
+    try:
+        assert client.get("/protected").status_code == 401
+    finally:
+        client.cookies.clear()
+
+
+def test_cookie_authenticates_with_flag(monkeypatch):
+    monkeypatch.setattr(google_auth, "AUTH_HTTPONLY_COOKIE", True)
+    client.cookies.set("access_token", _token())
+    try:
+        resp = client.get("/protected")
+    finally:
+        client.cookies.clear()
+    assert resp.status_code == 200
+    assert resp.json() == {"email": "ana@example.com"}
+
+
+def test_bearer_header_always_accepted(monkeypatch):
+    monkeypatch.setattr(google_auth, "AUTH_HTTPONLY_COOKIE", False)
+    resp = client.get("/protected", headers={"Authorization": f"Bearer {_token()}"})
+    assert resp.status_code == 200
+
+
+def test_me_endpoint_follows_cookie_flag(monkeypatch):
+    from src import api_auth_endpoints
+
+    me_app = FastAPI()
+    me_app.include_router(api_auth_endpoints.auth_router)
+    me_client = TestClient(me_app, cookies={"access_token": _token()})
+
+    monkeypatch.setattr(api_auth_endpoints, "AUTH_HTTPONLY_COOKIE", False)
+    assert me_client.get("/api/auth/me").status_code == 401
+    monkeypatch.setattr(api_auth_endpoints, "AUTH_HTTPONLY_COOKIE", True)
+    resp = me_client.get("/api/auth/me")
+    assert resp.status_code == 200
+    assert resp.json()["user"]["email"] == "ana@example.com"
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Pruebas de las cachés de users_db vistas desde los endpoints de autenticación
+(login vía google_auth y cambios de rol con update_role)
+"""
+
+import os
+import sys
+import uuid
+
+import pytest
+
+for _mod in ("sqlalchemy", "fastapi", "jwt", "httpx", "stripe"):
+    pytest.importorskip(_mod)
+
+# src en el path como en main_simple (la BD temporal la fija conftest.py)
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "src")]
+
+from sqlalchemy import select  # noqa: E402
+
+from src.auth import google_auth, users_db  # noqa: E402
+
+
+def _google_user():
+    uid = uuid.uuid4().hex
+    return {"id": uid, "email": f"{uid}@example.com", "name": "Ana", "picture": None}
+
+
+def test_update_role_clears_login_cache_and_persists():
+    g = _google_user()
+    user = google_auth.get_or_create_from_google(g, "student", "free")
+    assert google_auth.get_or_create_from_google(g, "student", "free") is user  # re-login cacheado
+
+    assert users_db.update_role(g["email"], "teacher")
+
+    assert users_db._user_cache == {}
+    with users_db.SessionLocal() as session:
+        stored = session.execute(select(users_db.User).where(users_db.User.email == g["email"])).scalar_one()
+    assert stored.role == "teacher"
+
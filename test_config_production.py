@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Prueba de humo de la configuración de producción (src/config_production.py)
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("pydantic_settings")
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def _run(code: str, **env: str) -> str:
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join([ROOT, os.environ.get("PYTHONPATH", "")]), **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip()
+
+
+def test_production_settings_import_and_env():
+    out = _run(
+        "import sys\n"
+        "from src import config_production as p\n"
+        "s = p.settings\n"
+        "print(s.api_port, s.groq_model, s.cdn_enabled, 'src.config' in sys.modules)",
+        PORT="9001", GROQ_MODEL="m1", CDN_ENABLED="true",
+    )
+    # src.config (y sus directorios) no se carga al importar la de producción
+    assert out == "9001 m1 True False"
+
+
+def test_validate_configuration_requires_groq_key():
+    out = _run(
+        "from src import config_production as p\n"
+        "try:\n"
+        "    p.validate_configuration()\n"
+        "except ValueError as e:\n"
+        "    print('GROQ_API_KEY' in str(e))",
+        GROQ_API_KEY="",
+    )
+    assert out == "True"
+
+
+def test_provider_credentials_are_validated_fields():
+    out = _run(
+        "from src import config_production as p\n"
+        "print(p.settings.model_dump()['aws_region'], p.settings.smtp_port)",
+        AWS_REGION="eu-west-1", SMTP_PORT="25",
+    )
+    assert out == "eu-west-1 25"
+
+    with pytest.raises(subprocess.CalledProcessError) as exc:
+        _run("from src import config_production", SMTP_PORT="not-a-port")
+    assert "smtp_port" in exc.value.stderr